@@ -1,10 +1,14 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models import db, Product, Brand, AlcoholCategory, BottleVolume, Price
-from datetime import datetime
-from sqlalchemy.orm import joinedload
-import csv
-import io
+from models import db, Product, Brand, AlcoholCategory
+from sales_rollups import move_product_sales
+from pricing import set_price, current_price
+from catalog_import import import_catalog
+from search_index import index_products, remove_products
+from catalog_cache import get_org_catalog, get_reference_data, bump_catalog_version
+from page_cache import bump_org_version
+from reorder import refresh_low_stock, set_category_reorder_point, category_reorder_points
+import codecs
 
 admin_inventory_bp = Blueprint('admin_inventory', __name__)
 
@@ -18,17 +22,17 @@ def manage_products():
         flash("Admins only!")
         return redirect(url_for("inventory.inventory"))
 
-    products = Product.query.options(
-        joinedload(Product.brand),
-        joinedload(Product.category),
-        joinedload(Product.volume)
-    ).filter(Product.org_id == current_user.org_id).all()
+    products = get_org_catalog(current_user.org_id)
+    brands, categories, volumes = get_reference_data()
 
-    brands = Brand.query.all()
-    categories = AlcoholCategory.query.all()
-    volumes = BottleVolume.query.all()
+    return render_template("manage_products.html", products=products, brands=brands, categories=categories, volumes=volumes,
+                           category_points=category_reorder_points(current_user.org_id))
 
-    return render_template("manage_products.html", products=products, brands=brands, categories=categories, volumes=volumes)
+
+def _reorder_point_field():
+    """The form's reorder point; blank means inherit the category's (or the default)."""
+    value = request.form.get("reorder_point", "").strip()
+    return max(0, int(value)) if value else None
 
 @admin_inventory_bp.route("/admin/products/add", methods=["POST"])
 @login_required
@@ -82,18 +86,18 @@ def add_product():
             brand_id=brand_id,
             category_id=category_id,
             volume_id=volume_id,
-            org_id=current_user.org_id
+            org_id=current_user.org_id,
+            reorder_point=_reorder_point_field()
         )
         db.session.add(new_product)
         db.session.flush()
 
-        new_price = Price(
-            product_id=new_product.product_id,
-            price=price,
-            updated_by=current_user.user_id
-        )
-        db.session.add(new_price)
+        set_price(new_product.product_id, current_user.org_id, price, current_user.user_id)
+        index_products([new_product.product_id])
+        refresh_low_stock(current_user.org_id, [new_product.product_id])
+        bump_org_version(current_user.org_id)
         db.session.commit()
+        bump_catalog_version(current_user.org_id)
         flash("✅ Product added successfully.")
     except Exception as e:
         db.session.rollback()
@@ -115,26 +119,28 @@ def edit_product(product_id):
             flash("Unauthorized access.")
             return redirect(url_for("inventory.inventory"))
 
+        old_brand_id, old_category_id = product.brand_id, product.category_id
         product.product_name = request.form["product_name"].strip()
         product.brand_id = int(request.form["brand_id"])
         product.category_id = int(request.form["category_id"])
         product.volume_id = int(request.form["volume_id"])
+        product.reorder_point = _reorder_point_field()
 
         price_val = request.form.get("price")
         if price_val:
-            price = Price.query.filter_by(product_id=product_id).order_by(Price.effective_date.desc()).first()
-            if price:
-                price.price = float(price_val)
-                price.effective_date = datetime.now()
-            else:
-                new_price = Price(
-                    product_id=product_id,
-                    price=float(price_val),
-                    updated_by=current_user.user_id
-                )
-                db.session.add(new_price)
-
+            # Append to the price history instead of rewriting it, so
+            # back-dated sales still see the price that applied then
+            new_price = round(float(price_val), 2)
+            if current_price(product_id) != new_price:
+                set_price(product_id, current_user.org_id, new_price, current_user.user_id)
+
+        move_product_sales(current_user.org_id, product_id, old_brand_id, old_category_id,
+                           product.brand_id, product.category_id)
+        index_products([product_id])
+        refresh_low_stock(current_user.org_id, [product_id])
+        bump_org_version(current_user.org_id)
         db.session.commit()
+        bump_catalog_version(current_user.org_id)
         flash("Product updated.")
     except Exception as e:
         db.session.rollback()
@@ -143,6 +149,26 @@ def edit_product(product_id):
 
     return redirect(url_for("admin_inventory.manage_products"))
 
+@admin_inventory_bp.route("/admin/products/reorder_points", methods=["POST"])
+@login_required
+def set_reorder_point():
+    if not is_admin():
+        flash("Admins only!")
+        return redirect(url_for("inventory.inventory"))
+
+    try:
+        category_id = int(request.form["category_id"])
+        set_category_reorder_point(current_user.org_id, category_id, _reorder_point_field())
+        bump_org_version(current_user.org_id)
+        db.session.commit()
+        flash("✅ Category reorder point saved.")
+    except Exception as e:
+        db.session.rollback()
+        flash("❌ Error saving reorder point.")
+        print("[Reorder Point Error]", e)
+
+    return redirect(url_for("admin_inventory.manage_products"))
+
 @admin_inventory_bp.route("/admin/products/delete/<int:product_id>", methods=["POST"])
 @login_required
 def delete_product(product_id):
@@ -157,7 +183,11 @@ def delete_product(product_id):
             return redirect(url_for("admin_inventory.manage_products"))
 
         db.session.delete(product)
+        remove_products([product_id])
+        refresh_low_stock(current_user.org_id, [product_id])
+        bump_org_version(current_user.org_id)
         db.session.commit()
+        bump_catalog_version(current_user.org_id)
         flash("Product deleted.")
     except Exception as e:
         db.session.rollback()
@@ -179,63 +209,19 @@ def upload_products_csv():
         return redirect(url_for("admin_inventory.manage_products"))
 
     try:
-        stream = io.StringIO(file.stream.read().decode("UTF8"))
-        reader = csv.DictReader(stream)
-
-        for row in reader:
-            name = row["Name"].strip()
-            ml = int(row["ML"].strip())
-            category_name = row["Category"].strip()
-
-            brand = Brand.query.filter_by(brand_name=name).first()
-            if not brand:
-                brand = Brand(brand_name=name)
-                db.session.add(brand)
-                db.session.flush()
-
-            category = AlcoholCategory.query.filter_by(category_name=category_name).first()
-            if not category:
-                category = AlcoholCategory(category_name=category_name)
-                db.session.add(category)
-                db.session.flush()
-
-            volume = BottleVolume.query.filter_by(volume_ml=ml).first()
-            if not volume:
-                volume = BottleVolume(volume_ml=ml)
-                db.session.add(volume)
-                db.session.flush()
-
-            existing_product = Product.query.filter_by(
-                product_name=name,
-                brand_id=brand.brand_id,
-                category_id=category.category_id,
-                volume_id=volume.volume_id,
-                org_id=current_user.org_id
-            ).first()
-
-            if not existing_product:
-                product = Product(
-                    product_name=name,
-                    brand_id=brand.brand_id,
-                    category_id=category.category_id,
-                    volume_id=volume.volume_id,
-                    org_id=current_user.org_id
-                )
-                db.session.add(product)
-                db.session.flush()
-
-                price = Price(
-                    product_id=product.product_id,
-                    price=0.00,
-                    updated_by=current_user.user_id
-                )
-                db.session.add(price)
-
-        db.session.commit()
-        flash("Products uploaded successfully.")
+        lines = codecs.iterdecode(file.stream, "utf-8-sig")
+        summary = import_catalog(lines, current_user.org_id, current_user.user_id)
+        counts = (f"Inserted {summary['inserted']}, skipped {summary['skipped']}, "
+                  f"failed {summary['failed']} ({summary['rows_per_sec']:.0f} rows/s).")
+        if summary.get("error"):
+            flash(f"⚠️ CSV partly uploaded ({summary['error']}). {counts}")
+        else:
+            flash(f"Products uploaded successfully. {counts}")
     except Exception as e:
         db.session.rollback()
         flash("Error uploading CSV.")
         print(e)
+    finally:
+        bump_catalog_version(current_user.org_id)  # Chunks committed before an error are in the catalog too
 
     return redirect(url_for("admin_inventory.manage_products"))
\ No newline at end of file
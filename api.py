@@ -0,0 +1,361 @@
+import base64
+import json
+from collections import defaultdict
+from datetime import datetime, date, timedelta
+from functools import wraps
+from flask import Blueprint, Response, current_app, request
+from flask_login import current_user
+from sqlalchemy import func, inspect, text, tuple_, update
+from models import db, Stock, Sale, CurrentPrice
+from catalog_cache import get_org_catalog
+from inventory import save_stock_quantities
+from sales import post_sales
+from sales_ingest import read_lines, batches, ingest_batch, DEFAULT_BATCH_SIZE
+from reorder import reorder_list
+from forecasting import forecasting_available, org_model, order_suggestions
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the stdlib encoder
+    orjson = None
+
+# Versioned JSON API for tablets and other clients. Every GET carries a
+# content ETag and answers If-None-Match with 304. /changes returns stock,
+# current prices and sales written after a sync cursor. Each stream is
+# ordered by its timestamp column (Stock.last_updated,
+# CurrentPrice.effective_date, Sale.updated_at) plus id, and only rows older
+# than API_SYNC_SETTLE_SECONDS are handed out. A row stamped just before a
+# slow commit therefore cannot land behind a cursor that was already
+# returned. Product renames and deletes are not streamed: refetch /products
+# when its ETag changes.
+
+api_bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+DEFAULT_LIMIT = 1000
+MAX_LIMIT = 5000
+MAX_FORECAST_DAYS = 90
+EPOCH = datetime(1970, 1, 1)
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+@api_bp.errorhandler(ApiError)
+def api_error(error):
+    return _json({"error": error.message}, status=error.status, etag=False)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return float(value)  # Decimal
+
+
+def _dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode()
+
+
+def _json(payload, status=200, etag=True):
+    response = Response(_dumps(payload), status=status, mimetype="application/json")
+    if etag:
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+def api_login_required(view):
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if not current_user.is_authenticated:
+            raise ApiError("Authentication required.", 401)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+def _require_manager():
+    if current_user.role not in ["admin", "manager"]:
+        raise ApiError("Admins and Managers only.", 403)
+
+
+def _limit():
+    try:
+        return max(1, min(int(request.args.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+    except ValueError:
+        raise ApiError("limit must be an integer.")
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ApiError(f"{name} must be an integer.")
+
+
+def _date_arg(name, default=None):
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise ApiError(f"{name} must be YYYY-MM-DD.")
+
+
+def _quantities(payload):
+    try:
+        return {int(product_id): int(quantity) for product_id, quantity in payload["quantities"].items()}
+    except (KeyError, AttributeError, TypeError, ValueError):
+        raise ApiError('Expected {"quantities": {"<product_id>": <quantity>, ...}}.')
+
+
+# ------------------------------------------------------------------ reads
+
+@api_bp.route("/products")
+@api_login_required
+def products():
+    return _json({"products": get_org_catalog(current_user.org_id)})
+
+
+@api_bp.route("/prices")
+@api_login_required
+def prices():
+    rows = (
+        db.session.query(CurrentPrice.product_id, CurrentPrice.price, CurrentPrice.effective_date)
+        .filter(CurrentPrice.org_id == current_user.org_id)
+        .order_by(CurrentPrice.product_id)
+    )
+    return _json({"prices": [row._asdict() for row in rows]})
+
+
+@api_bp.route("/inventory")
+@api_login_required
+def inventory():
+    """Stock levels keyset-paginated by product_id (?after=<product_id>&limit=)."""
+    limit = _limit()
+    query = (
+        db.session.query(Stock.product_id, Stock.quantity, Stock.last_updated)
+        .filter(Stock.org_id == current_user.org_id)
+    )
+    after = _int_arg("after")
+    if after is not None:
+        query = query.filter(Stock.product_id > after)
+    rows = query.order_by(Stock.product_id).limit(limit + 1).all()
+    page = [row._asdict() for row in rows[:limit]]
+    return _json({"stock": page, "next": page[-1]["product_id"] if len(rows) > limit else None})
+
+
+@api_bp.route("/sales")
+@api_login_required
+def sales():
+    """Sales for ?date= or ?from=&to= (default today), keyset-paginated by sale_id."""
+    day = _date_arg("date")
+    date_from = day or _date_arg("from", date.today())
+    date_to = day or _date_arg("to", date_from)
+    limit = _limit()
+    query = (
+        db.session.query(Sale.sale_id, Sale.product_id, Sale.sale_date, Sale.quantity_sold,
+                         Sale.total_price, Sale.updated_at)
+        .filter(Sale.org_id == current_user.org_id, Sale.sale_date >= date_from, Sale.sale_date <= date_to)
+    )
+    after = _int_arg("after")
+    if after is not None:
+        query = query.filter(Sale.sale_id > after)
+    rows = query.order_by(Sale.sale_id).limit(limit + 1).all()
+    page = [row._asdict() for row in rows[:limit]]
+    return _json({"sales": page, "next": page[-1]["sale_id"] if len(rows) > limit else None})
+
+
+@api_bp.route("/reorder")
+@api_login_required
+def reorder():
+    """Products below their reorder point, emptiest first; see reorder.py."""
+    return _json({"reorder": reorder_list(current_user.org_id)})
+
+
+@api_bp.route("/forecast")
+@api_login_required
+def forecast():
+    """Suggested orders for ?lead_days=&review_days=, soonest stock-out first; see forecasting.py.
+
+    ?all=1 also lists products that need no order. days_of_cover is null when
+    the product has no demand or lasts beyond the forecast horizon.
+    """
+    if not forecasting_available():
+        raise ApiError("Forecasting requires NumPy on the server.", 503)
+    config = current_app.config
+    days = {}
+    for name, default in (("lead_days", config.get("FORECAST_LEAD_DAYS", 7)),
+                          ("review_days", config.get("FORECAST_REVIEW_DAYS", 7))):
+        value = _int_arg(name)
+        days[name] = default if value is None else value
+        if not 0 <= days[name] <= MAX_FORECAST_DAYS:
+            raise ApiError(f"{name} must be between 0 and {MAX_FORECAST_DAYS}.")
+
+    rows = order_suggestions(org_model(current_user.org_id), days["lead_days"], days["review_days"],
+                             config.get("FORECAST_SERVICE_Z", 1.65), include_all=request.args.get("all") == "1")
+    names = {product["product_id"]: product["product_name"] for product in get_org_catalog(current_user.org_id)}
+    for row in rows:
+        row["product_name"] = names.get(row["product_id"])
+    return _json({"lead_days": days["lead_days"], "review_days": days["review_days"], "forecast": rows})
+
+
+# ------------------------------------------------------------------ delta sync
+
+# stream -> (model, timestamp column, id column, columns returned)
+CHANGE_STREAMS = {
+    "stock": (Stock, Stock.last_updated, Stock.stock_id, (Stock.product_id, Stock.quantity, Stock.last_updated)),
+    "prices": (CurrentPrice, CurrentPrice.effective_date, CurrentPrice.product_id,
+               (CurrentPrice.product_id, CurrentPrice.price, CurrentPrice.effective_date)),
+    "sales": (Sale, Sale.updated_at, Sale.sale_id, (Sale.sale_id, Sale.product_id, Sale.sale_date,
+                                                    Sale.quantity_sold, Sale.total_price, Sale.updated_at)),
+}
+
+
+def encode_sync_cursor(positions):
+    raw = json.dumps({stream: [ts.isoformat(), row_id] for stream, (ts, row_id) in positions.items()}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_sync_cursor(cursor):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {stream: (datetime.fromisoformat(raw[stream][0]), int(raw[stream][1])) for stream in CHANGE_STREAMS}
+    except (ValueError, KeyError, TypeError, IndexError):
+        raise ApiError("Invalid sync cursor; start over without ?since=.")
+
+
+@api_bp.route("/changes")
+@api_login_required
+def changes():
+    """Rows written since ?since=<cursor>; without a cursor, everything so far.
+
+    Each stream returns at most ?limit= rows; ``more`` is true when any stream
+    was cut short, in which case the client calls again with the new cursor.
+    """
+    limit = _limit()
+    since = request.args.get("since")
+    positions = decode_sync_cursor(since) if since else {stream: (EPOCH, 0) for stream in CHANGE_STREAMS}
+    settle = current_app.config.get("API_SYNC_SETTLE_SECONDS", 2)
+    horizon = datetime.now() - timedelta(seconds=settle)
+
+    payload, more = {}, False
+    for stream, (model, stamp, row_id, columns) in CHANGE_STREAMS.items():
+        after_ts, after_id = positions[stream]
+        rows = (
+            db.session.query(*columns, row_id.label("_row_id"), stamp.label("_stamp"))
+            .filter(model.org_id == current_user.org_id, stamp.isnot(None), stamp <= horizon,
+                    tuple_(stamp, row_id) > tuple_(after_ts, after_id))
+            .order_by(stamp, row_id)
+            .limit(limit + 1)
+            .all()
+        )
+        more = more or len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            positions[stream] = (rows[-1]._stamp, rows[-1]._row_id)
+        payload[stream] = [
+            {key: value for key, value in row._asdict().items() if not key.startswith("_")} for row in rows
+        ]
+
+    payload["cursor"] = encode_sync_cursor(positions)
+    payload["more"] = more
+    return _json(payload)
+
+
+# ------------------------------------------------------------------ writes
+
+@api_bp.route("/inventory", methods=["POST"])
+@api_login_required
+def update_inventory():
+    """Set stock levels: {"quantities": {"<product_id>": <quantity>}}."""
+    _require_manager()
+    quantities = _quantities(request.get_json(silent=True) or {})
+    try:
+        changed, elapsed_ms = save_stock_quantities(current_user.org_id, current_user.user_id, quantities)
+    except Exception as e:
+        db.session.rollback()
+        print(f"[API Inventory Error] {e}")
+        raise ApiError("Error updating stock.", 500)
+    return _json({"changed": changed}, etag=False)
+
+
+@api_bp.route("/sales", methods=["POST"])
+@api_login_required
+def update_sales():
+    """Post a day's sold quantities: {"date": "YYYY-MM-DD", "quantities": {...}}."""
+    _require_manager()
+    payload = request.get_json(silent=True) or {}
+    try:
+        sale_date = datetime.strptime(payload.get("date") or date.today().isoformat(), "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        raise ApiError("date must be YYYY-MM-DD.")
+    quantities = {product_id: quantity for product_id, quantity in _quantities(payload).items() if quantity >= 0}
+    try:
+        changed, errors = post_sales(current_user.org_id, current_user.user_id, sale_date, quantities)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[API Sales Error] {e}")
+        raise ApiError("Error updating sales.", 500)
+    return _json({"changed": changed, "errors": errors}, etag=False)
+
+
+@api_bp.route("/sales/ingest", methods=["POST"])
+@api_login_required
+def ingest_sales():
+    """Stream POS sale lines (NDJSON or CSV) under an Idempotency-Key header; see sales_ingest.py."""
+    _require_manager()
+    key = (request.headers.get("Idempotency-Key") or "").strip()
+    if not key or len(key) > 150:
+        raise ApiError("An Idempotency-Key header (up to 150 characters) is required.")
+    batch_size = current_app.config.get("INGEST_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+    results, batch_count, replayed = [], 0, 0
+    lines = read_lines(request.stream, request.content_type)
+    for batch_count, batch in enumerate(batches(lines, batch_size), start=1):
+        try:
+            batch_results, was_replayed = ingest_batch(current_user.org_id, current_user.user_id,
+                                                       f"{key}:{batch_count}", batch)
+        except Exception as e:
+            db.session.rollback()
+            print(f"[API Ingest Error] {e}")
+            # Earlier batches stay committed; retrying with the same key replays them
+            return _json({"error": "Error applying batch; retry with the same Idempotency-Key.",
+                          "failed_batch": batch_count, "results": results}, status=500, etag=False)
+        results += batch_results
+        replayed += was_replayed
+
+    counts = defaultdict(int)
+    for result in results:
+        counts[result["status"]] += 1
+    return _json({
+        "lines": len(results),
+        "accepted": counts["ok"],
+        "rejected": counts["rejected"],
+        "errors": counts["error"],
+        "batches": batch_count,
+        "replayed_batches": replayed,
+        "results": results
+    }, etag=False)
+
+
+def ensure_sync_columns():
+    """Add Sale.updated_at on databases that predate it; ensure_indexes adds its index."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Sale.__tablename__):
+        return
+    if "updated_at" not in {column["name"] for column in inspector.get_columns(Sale.__tablename__)}:
+        # Existing sales count as written on their sale date
+        written = func.datetime(Sale.sale_date) if db.engine.dialect.name == "sqlite" else Sale.sale_date
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {Sale.__tablename__} ADD COLUMN updated_at DATETIME"))
+            conn.execute(update(Sale).values(updated_at=written))
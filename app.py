@@ -2,17 +2,56 @@ from flask import Flask, render_template, request, redirect, url_for, flash
 from models import db, User
 from auth import auth_bp, login_manager
 from flask_login import login_required, current_user
-from werkzeug.security import generate_password_hash
+from passwords import password_hasher, hash_password
 from utils import log_action  # Import the log_action function
 from inventory import inventory_bp  # ✅ Add this line
 from admin_inventory import admin_inventory_bp
 from sales import sales_bp
+from api import api_bp, ensure_sync_columns
+from sales_ingest import ensure_ingest_batches
+from page_cache import ensure_org_versions, page_cache_stats
+from db_engine import configure_engine
+from search_index import search_available
+from pricing import ensure_current_prices
+from reorder import ensure_low_stock
+from forecasting import forecast_stats
+from schema_upgrade import ensure_indexes
+from retention import ensure_retention_tables
+from stock_snapshots import ensure_stock_snapshots
+from sales_rollups import ensure_sales_rollups, dashboard_data
+from catalog_cache import get_reference_data, cache_stats
+from audit_log import audit_log
+from user_cache import invalidate_user, user_cache_stats
+from metrics import metrics
+from sharding import sharding_enabled, on_shard_open, check_directory
 
 app = Flask(__name__)
 app.config.from_object('config')  # Load configuration from config.py
+configure_engine(app)
 
 db.init_app(app)
 login_manager.init_app(app)
+audit_log.init_app(app)
+password_hasher.init_app(app)
+metrics.init_app(app)
+
+@metrics.add_collector
+def cache_and_audit_samples():
+    audit, catalog, users, pages = audit_log.stats(), cache_stats(), user_cache_stats(), page_cache_stats()
+    forecasts = forecast_stats()
+    return [
+        ("audit_log_queued", "Audit records waiting to be written.", "gauge", audit["queued"]),
+        ("audit_log_written_total", "Audit records written.", "counter", audit["written"]),
+        ("audit_log_dropped_total", "Audit records dropped (queue full or write failed).", "counter", audit["dropped"]),
+        ("catalog_cache_hits_total", "Catalog cache hits.", "counter", catalog["hits"]),
+        ("catalog_cache_misses_total", "Catalog cache misses.", "counter", catalog["misses"]),
+        ("user_cache_hits_total", "Logged-in user cache hits.", "counter", users["hits"]),
+        ("user_cache_misses_total", "Logged-in user cache misses.", "counter", users["misses"]),
+        ("page_cache_hits_total", "Rendered page cache hits.", "counter", pages["hits"]),
+        ("page_cache_misses_total", "Rendered page cache misses.", "counter", pages["misses"]),
+        ("forecast_cache_hits_total", "Forecast model cache hits.", "counter", forecasts["hits"]),
+        ("forecast_cache_misses_total", "Forecast model cache misses.", "counter", forecasts["misses"]),
+    ]
 
 app.register_blueprint(auth_bp, url_prefix='/auth')
 
@@ -32,7 +71,17 @@ def home():
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    return render_template('dashboard.html')
+    if current_user.role not in ['admin', 'manager']:
+        return render_template('dashboard.html', analytics=None)
+
+    analytics = dashboard_data(current_user.org_id)
+    brands, categories, _ = get_reference_data()
+    return render_template(
+        'dashboard.html',
+        analytics=analytics,
+        brand_names={brand.brand_id: brand.brand_name for brand in brands},
+        category_names={cat.category_id: cat.category_name for cat in categories}
+    )
 
 @app.route("/admin/users", methods=['GET', 'POST'])
 @login_required
@@ -53,7 +102,7 @@ def manage_users():
             flash('Email address already registered')
             return redirect(url_for('manage_users'))
 
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+        hashed_password = hash_password(password)
         new_user = User(name=name, email=email, password_hash=hashed_password, role=role, org_id=current_user.org_id, needs_password_change=True)
         
         try:
@@ -77,10 +126,11 @@ def reset_password(user_id):
     user = User.query.get(user_id)
     if user:
         new_password = request.form.get('new_password')
-        hashed_password = generate_password_hash(new_password, method='pbkdf2:sha256')
+        hashed_password = hash_password(new_password)
         user.password_hash = hashed_password
         user.needs_password_change = True
         db.session.commit()
+        invalidate_user(user.user_id)
         flash('Password reset successfully')
     else:
         flash('User not found')
@@ -111,6 +161,7 @@ def delete_user(user_id):
 
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         flash('User deleted successfully')
     else:
         flash('User not found')
@@ -119,6 +170,29 @@ def delete_user(user_id):
 app.register_blueprint(inventory_bp)
 app.register_blueprint(admin_inventory_bp)
 app.register_blueprint(sales_bp)
+app.register_blueprint(api_bp)
+
+# Tenant shards are created from the models when first opened; these bring
+# them up to date the same way the startup hooks below do for one database
+on_shard_open(ensure_indexes)
+on_shard_open(search_available)
+
+# Build derived tables up front, outside any request transaction
+with app.app_context():
+    if sharding_enabled():
+        check_directory()  # Tenant rows left from running unsharded need "python sharding.py migrate"
+        ensure_indexes()  # Only the directory is here; shards start at the current schema
+    else:
+        ensure_low_stock()  # Adds products.reorder_point, so it runs before anything loads Product
+        ensure_current_prices()
+        ensure_sync_columns()
+        ensure_ingest_batches()
+        ensure_org_versions()
+        ensure_stock_snapshots()
+        ensure_sales_rollups()
+        ensure_retention_tables()
+        ensure_indexes()
+        search_available()
 
 if __name__ == "__main__":
     app.run(debug=True)
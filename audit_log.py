@@ -0,0 +1,126 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from flask import current_app
+from models import db, UserActionLog
+
+# Audit records are queued in-process and written by a background thread in
+# batched inserts on their own connection, so request latency no longer
+# includes an audit commit and log_action never commits the caller's session.
+# The queue is bounded: when it is full, records are dropped and counted
+# rather than blocking the request. Whatever is still queued at interpreter
+# exit is written by the atexit hook.
+
+
+class AuditLogWriter:
+    def __init__(self, maxsize=10000, batch_size=100, flush_interval=1.0):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.app = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize)
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        self.app = app
+        self.maxsize = app.config.get("AUDIT_LOG_QUEUE_SIZE", self.maxsize)
+        self.batch_size = app.config.get("AUDIT_LOG_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get("AUDIT_LOG_FLUSH_INTERVAL", self.flush_interval)
+        self._queue = queue.Queue(self.maxsize)
+
+    def enqueue(self, user_id, action):
+        if self.app is None:
+            self.app = current_app._get_current_object()
+        self._ensure_thread()
+        record = {
+            "user_id": user_id,
+            "action": action[:255],
+            # Same clock as the column's CURRENT_TIMESTAMP default (UTC)
+            "timestamp": datetime.now(timezone.utc).replace(tzinfo=None)
+        }
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        while self._write_batch():
+            pass
+
+    def shutdown(self, timeout=5.0):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._wake.set()
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def _after_fork(self):
+        # A forked worker inherits the queue and locks but not the thread
+        self._queue = queue.Queue(self.maxsize)
+        self._write_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _write_batch(self):
+        with self._write_lock:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return False
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(UserActionLog.__table__.insert(), batch)
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.dropped += len(batch)
+                print(f"[Audit Log Error] {e}")
+            return True
+
+
+audit_log = AuditLogWriter()
+atexit.register(audit_log.shutdown)
+os.register_at_fork(after_in_child=audit_log._after_fork)
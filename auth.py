@@ -1,8 +1,9 @@
 from flask import Blueprint, request, redirect, url_for, render_template, flash
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password, needs_rehash
 from models import db, User, Organization
 from utils import log_action
+from user_cache import get_user, invalidate_user
 from datetime import datetime, timedelta
 import pyotp
 import re
@@ -17,7 +18,7 @@ LOCKOUT_DURATION = timedelta(minutes=15)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return get_user(int(user_id))
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def login():
@@ -37,10 +38,14 @@ def login():
                     flash('Account is locked. Please try again later.')
                     return redirect(url_for('auth.login'))
 
-            if check_password_hash(user.password_hash, password):
+            if verify_password(user.password_hash, password):
                 login_user(user)
                 user.failed_login_attempts = 0  # Reset on successful login
+                if needs_rehash(user.password_hash):
+                    # Hash parameters changed since this password was set
+                    user.password_hash = hash_password(password)
                 db.session.commit()
+                invalidate_user(user.user_id)
 
                 # Redirect to 2FA verification only if 2FA is set up
                 if user.otp_secret:
@@ -63,6 +68,7 @@ def login():
                 else:
                     flash('Invalid email or password')
                 db.session.commit()
+                invalidate_user(user.user_id)
         else:
             flash('Invalid email or password')
     return render_template('login.html')
@@ -102,13 +108,14 @@ def register():
             flash('Email address already registered')
             return redirect(url_for('auth.register'))
 
+        hashed_password = hash_password(password)
+
         # Create new organization
         new_org = Organization(org_name=org_name)
         db.session.add(new_org)
         db.session.commit()
 
         # Create new user as admin of the new organization
-        hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
         new_user = User(name=name, email=email, password_hash=hashed_password, role='admin', org_id=new_org.org_id, otp_secret=None)
         
         try:
@@ -131,20 +138,21 @@ def change_password():
         new_password = request.form.get('new_password')
 
         # Check if the old password is correct
-        if not check_password_hash(current_user.password_hash, old_password):
+        if not verify_password(current_user.password_hash, old_password):
             flash('Old password is incorrect')
             return redirect(url_for('auth.change_password'))
 
         # Check if the new password is different from the old password
-        if check_password_hash(current_user.password_hash, new_password):
+        if verify_password(current_user.password_hash, new_password):
             flash('New password cannot be the same as the old password')
             return redirect(url_for('auth.change_password'))
 
         # Update the password
-        hashed_password = generate_password_hash(new_password, method='pbkdf2:sha256')
+        hashed_password = hash_password(new_password)
         current_user.password_hash = hashed_password
         current_user.needs_password_change = False
         db.session.commit()
+        invalidate_user(current_user.user_id)
 
         # Log the password change action
         log_action(current_user.user_id, "Password changed")
@@ -164,6 +172,7 @@ def profile():
             if not current_user.otp_secret:
                 current_user.otp_secret = pyotp.random_base32()
                 db.session.commit()
+                invalidate_user(current_user.user_id)
             otp_uri = pyotp.totp.TOTP(current_user.otp_secret).provisioning_uri(
                 current_user.email, issuer_name="MyApp"
             )
@@ -181,6 +190,7 @@ def profile():
         elif 'disable_2fa' in request.form:
             current_user.otp_secret = None
             db.session.commit()
+            invalidate_user(current_user.user_id)
             flash('2FA has been disabled.')
 
         # Update user name
@@ -194,7 +204,7 @@ def profile():
 
         if old_password and new_password:
             # Check if the old password is correct
-            if not check_password_hash(current_user.password_hash, old_password):
+            if not verify_password(current_user.password_hash, old_password):
                 flash('Old password is incorrect')
                 return redirect(url_for('auth.profile'))
 
@@ -204,10 +214,11 @@ def profile():
                 return redirect(url_for('auth.profile'))
 
             # Update the password
-            hashed_password = generate_password_hash(new_password, method='pbkdf2:sha256')
+            hashed_password = hash_password(new_password)
             current_user.password_hash = hashed_password
 
         db.session.commit()
+        invalidate_user(current_user.user_id)
 
         # Log the profile update action
         log_action(current_user.user_id, "Profile updated")
@@ -229,6 +240,7 @@ def setup_2fa():
             current_user.email, issuer_name="MyApp"
         )
         db.session.commit()  # Ensure the secret is saved
+        invalidate_user(current_user.user_id)
 
     if request.method == 'POST':
         otp = request.form.get('otp')
@@ -0,0 +1,195 @@
+"""Endpoint benchmarks at several data scales, with p50/p95 latency and query counts.
+
+Each scale runs in its own process against a fresh SQLite file filled by
+generate_data.py, logs in as the first org's admin and drives the key
+routes through the Flask test client. The page cache is off so the
+inventory and sales pages are rendered on every request; their
+"(cached)" rows time the same pages served from it. Results go to a JSON
+file that a later run can be compared against.
+
+    python benchmarks/bench_routes.py --scales small,medium --repeat 20 --output bench.json
+    python benchmarks/bench_routes.py --scales small --compare bench.json
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from generate_data import SCALES  # noqa: E402
+
+# Routes behind page_cache.conditional_page, timed a second time with the cache on
+CACHED_ROUTES = ("inventory", "inventory search", "sales page")
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _routes(product_ids, today):
+    """(name, method, url, data factory) for every benchmarked route; factories get the iteration number."""
+    month_ago = (today - timedelta(days=29)).isoformat()
+    yesterday = (today - timedelta(days=1)).isoformat()
+
+    def stock_form(i):
+        form = {f"quantity[{pid}]": str((pid + i) % 150) for pid in product_ids[:50]}
+        form["update_all"] = "1"
+        return form
+
+    def sales_form(i):
+        form = {f"quantity_{pid}": str((pid + i) % 4) for pid in product_ids[:100]}
+        form["sale_date"] = today.isoformat()
+        return form
+
+    def upload(i):
+        rows = "".join(f"Bench Upload {i}-{n},750,Gin\n" for n in range(100))
+        return {"csv_file": (io.BytesIO(("Name,ML,Category\n" + rows).encode()), "upload.csv")}
+
+    return [
+        ("dashboard", "GET", "/dashboard", None),
+        ("inventory", "GET", "/inventory", None),
+        ("inventory sorted by quantity", "GET", "/inventory?sort=quantity&dir=desc", None),
+        ("inventory search", "GET", "/inventory?search=reserve", None),
+        ("inventory update_all", "POST", "/inventory/bulk_update", stock_form),
+        ("sales page", "GET", f"/sales?date={yesterday}", None),
+        ("sales update", "POST", "/sales/update", sales_form),
+        ("sales csv day", "GET", f"/sales/download_csv/{yesterday}", None),
+        ("sales csv 30 days", "GET", f"/sales/download_csv?from={month_ago}&to={today.isoformat()}", None),
+        ("manage products", "GET", "/admin/products", None),
+        ("forecast", "GET", "/api/v1/forecast", None),
+        ("catalog upload", "POST", "/admin/products/upload", upload),
+    ]
+
+
+def run_scale(scale, repeat, warmup, seed):
+    """Generate data for ``scale`` and time every route; runs in a child process."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app
+    from models import db, Product
+    from generate_data import generate
+    from sharding import tenant_scope
+
+    params = SCALES[scale]
+    app.config["TESTING"] = True
+    with app.app_context():
+        started = time.perf_counter()
+        counts = generate(seed=seed, **params)
+        generate_seconds = time.perf_counter() - started
+        with tenant_scope(1):
+            product_ids = [pid for (pid,) in db.session.query(Product.product_id)
+                           .filter(Product.org_id == 1).order_by(Product.product_id)]
+
+    queries = [0]
+
+    @event.listens_for(Engine, "before_cursor_execute")  # Every engine, tenant shards included
+    def count_query(*args):
+        queries[0] += 1
+
+    client = app.test_client()
+    client.post("/auth/login", data={"email": "admin1@bench.local", "password": "benchmark"})
+
+    routes = [(name, method, url, data, False) for name, method, url, data in _routes(product_ids, date.today())]
+    routes += [(f"{name} (cached)", method, url, data, True) for name, method, url, data, _ in routes
+               if name in CACHED_ROUTES]
+    results = {}
+    for name, method, url, data, cached in routes:
+        app.config["PAGE_CACHE_ENABLED"] = cached
+        latencies, query_counts, statuses = [], [], set()
+        for i in range(warmup + repeat):
+            kwargs = {}
+            if data is not None:
+                kwargs["data"] = data(i)
+                if name == "catalog upload":
+                    kwargs["content_type"] = "multipart/form-data"
+            queries[0] = 0
+            started = time.perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()  # Drain streamed bodies inside the timing
+            elapsed = time.perf_counter() - started
+            if i >= warmup:
+                latencies.append(elapsed * 1000)
+                query_counts.append(queries[0])
+                statuses.add(response.status_code)
+        results[name] = {
+            "method": method,
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": round(_percentile(latencies, 0.5), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "mean_ms": round(statistics.mean(latencies), 2),
+            "queries_p50": _percentile(query_counts, 0.5),
+            "queries_max": max(query_counts),
+        }
+    return {"scale": scale, "params": params, "rows": counts,
+            "generate_seconds": round(generate_seconds, 1), "repeat": repeat, "routes": results}
+
+
+def _print_scale(result, baseline=None):
+    print(f"\n== {result['scale']} {result['params']} rows={result['rows']}")
+    print(f"{'route':<32}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'status':>10}" + ("   vs baseline p50" if baseline else ""))
+    for name, route in result["routes"].items():
+        line = (f"{name:<32}{route['p50_ms']:>10.1f}{route['p95_ms']:>10.1f}{route['queries_p50']:>9}"
+                f"{','.join(map(str, route['status'])):>10}")
+        before = (baseline or {}).get("routes", {}).get(name)
+        if before:
+            line += f"   {before['p50_ms']:.1f} -> {route['p50_ms']:.1f} ms ({route['p50_ms'] / max(before['p50_ms'], 0.01):.2f}x)"
+            line += f", queries {before['queries_p50']} -> {route['queries_p50']}"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default="small,medium", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier results file to print deltas against")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        result = run_scale(args.child, args.repeat, args.warmup, args.seed)
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result["scale"]: result for result in json.load(f)["results"]}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales.split(","):
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, scale + '.db')}",
+                       TENANT_DATABASE_URL=f"sqlite:///{os.path.join(tmp, scale + '_shards', '{shard}.db')}",
+                       # Keep the slow-request log quiet; the numbers land in the results file
+                       METRICS_SLOW_REQUEST_MS="3600000", METRICS_SLOW_REQUEST_STATEMENTS="1000000",
+                       METRICS_SLOW_QUERY_MS="3600000", PAGE_CACHE_ENABLED="0")
+            output = os.path.join(tmp, scale + ".json")
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--child", scale, "--repeat", str(args.repeat),
+                            "--warmup", str(args.warmup), "--seed", str(args.seed), "--output", output],
+                           env=env, check=True)
+            with open(output) as f:
+                results.append(json.load(f))
+            _print_scale(results[-1], baseline.get(scale))
+
+    with open(args.output, "w") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+"""Multi-process SQLite read/write throughput, default settings vs. tuned engine.
+
+Starts reader and writer processes against a fresh database file for each
+mode and reports completed operations per second plus "database is locked"
+failures. Readers run the inventory listing query; writers run an
+"Update All"-sized transaction (stock update plus ledger insert). The
+"sharded" mode is the tuned engine with one file per tenant, as with
+TENANT_SHARDING (see sharding.py); reader and writer n work on tenant
+n % --tenants.
+
+    python benchmarks/db_concurrency.py --readers 4 --writers 4 --seconds 10
+    python benchmarks/db_concurrency.py --mode all --tenants 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sqlalchemy import create_engine, select, update, insert, func, bindparam
+from sqlalchemy.exc import OperationalError
+import db_engine
+from models import db, Organization, Brand, AlcoholCategory, BottleVolume, Product, Stock, StockUpdate
+
+def make_engine(path, mode):
+    """Engine for one worker process; "baseline" is SQLite's defaults plus the old 5s timeout."""
+    url = f"sqlite:///{path}"
+    if mode == "baseline":
+        db_engine._sqlite_pragmas[:] = []
+        return create_engine(url, connect_args={"timeout": 5})
+    config = {"SQLALCHEMY_DATABASE_URI": url}
+    db_engine._sqlite_pragmas[:] = db_engine.sqlite_pragmas(config)
+    return create_engine(url, **db_engine.engine_options(config))
+
+
+def seed(path, mode, products):
+    engine = make_engine(path, mode)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Organization), [{"org_name": "Bench Bar"}])
+        conn.execute(insert(Brand), [{"brand_name": f"Brand {i}"} for i in range(50)])
+        conn.execute(insert(AlcoholCategory), [{"category_name": f"Category {i}"} for i in range(10)])
+        conn.execute(insert(BottleVolume), [{"volume_ml": ml} for ml in (375, 700, 750, 1000)])
+        conn.execute(insert(Product), [
+            {"product_name": f"Product {i}", "brand_id": i % 50 + 1, "category_id": i % 10 + 1,
+             "volume_id": i % 4 + 1, "org_id": 1}
+            for i in range(products)
+        ])
+        conn.execute(insert(Stock), [{"product_id": i + 1, "org_id": 1, "quantity": 100} for i in range(products)])
+    engine.dispose()
+
+
+def reader(path, mode, deadline, results):
+    engine = make_engine(path, mode)
+    query = (
+        select(Product.product_id, Product.product_name, Brand.brand_name, Stock.quantity)
+        .join(Brand, Brand.brand_id == Product.brand_id)
+        .outerjoin(Stock, Stock.product_id == Product.product_id)
+        .where(Product.org_id == 1)
+        .order_by(Product.product_name)
+        .limit(50)
+    )
+    done = errors = 0
+    while time.time() < deadline:
+        try:
+            with engine.connect() as conn:
+                conn.execute(query).fetchall()
+                conn.execute(select(func.count(Product.product_id)).where(Product.org_id == 1)).scalar()
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(("read", done, errors))
+
+
+def writer(path, mode, deadline, products, batch, results):
+    engine = make_engine(path, mode)
+    rng = random.Random(os.getpid())
+    done = errors = 0
+    while time.time() < deadline:
+        ids = rng.sample(range(1, products + 1), batch)
+        try:
+            with engine.begin() as conn:
+                # executemany, as bulk_update_mappings issues it
+                conn.execute(
+                    update(Stock).where(Stock.stock_id == bindparam("row_id")).values(quantity=bindparam("qty")),
+                    [{"row_id": product_id, "qty": rng.randint(0, 200)} for product_id in ids]
+                )
+                conn.execute(insert(StockUpdate), [
+                    {"product_id": product_id, "previous_quantity": 0, "new_quantity": 1} for product_id in ids
+                ])
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(("write", done, errors))
+
+
+def run_mode(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        tenants = args.tenants if mode == "sharded" else 1
+        paths = [os.path.join(tmp, f"bench_{n}.db") for n in range(tenants)]
+        for path in paths:
+            seed(path, mode, args.products)
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds
+        procs = [multiprocessing.Process(target=reader, args=(paths[n % tenants], mode, deadline, results))
+                 for n in range(args.readers)]
+        procs += [multiprocessing.Process(target=writer, args=(paths[n % tenants], mode, deadline, args.products,
+                                                               args.batch, results))
+                  for n in range(args.writers)]
+        for proc in procs:
+            proc.start()
+        totals = {"read": [0, 0], "write": [0, 0]}
+        for _ in procs:
+            kind, done, errors = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += errors
+        for proc in procs:
+            proc.join()
+
+    return {
+        "mode": mode,
+        "reads_per_sec": totals["read"][0] / args.seconds,
+        "writes_per_sec": totals["write"][0] / args.seconds,
+        "read_errors": totals["read"][1],
+        "write_errors": totals["write"][1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=50, help="stock rows changed per write transaction")
+    parser.add_argument("--mode", choices=["baseline", "tuned", "sharded", "both", "all"], default="both")
+    parser.add_argument("--tenants", type=int, default=4, help="database files in sharded mode")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    modes = {"both": ["baseline", "tuned"], "all": ["baseline", "tuned", "sharded"]}.get(args.mode, [args.mode])
+    results = [run_mode(mode, args) for mode in modes]
+
+    print(f"{'mode':<10}{'reads/s':>12}{'writes/s':>12}{'read errs':>12}{'write errs':>12}")
+    for result in results:
+        print(f"{result['mode']:<10}{result['reads_per_sec']:>12.1f}{result['writes_per_sec']:>12.1f}"
+              f"{result['read_errors']:>12}{result['write_errors']:>12}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Seeded synthetic data for benchmarks: orgs, catalogs, stock, sales, prices and ledger.
+
+Writes into the database configured for the app (DATABASE_URL or --database),
+replacing whatever is there, then rebuilds the derived tables (current prices, sales
+rollups, recent stock snapshots, low stock, search index). Every org gets an admin
+"admin<N>@bench.local" with password "benchmark". With TENANT_SHARDING set,
+each org's rows go to its shard and every shard gets the reference tables.
+It refuses to replace the app's default database (bar_inventory.db), or
+the default shard files when sharded, unless --force is given.
+
+    python benchmarks/generate_data.py --database /tmp/bench.db --orgs 2 --products 1000 --days 365
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/generate_data.py --scale medium
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+SCALES = {
+    "small": {"orgs": 1, "products": 200, "days": 90},
+    "medium": {"orgs": 2, "products": 1000, "days": 365},
+    "large": {"orgs": 3, "products": 3000, "days": 730},
+}
+
+CATEGORIES = ["Whiskey", "Vodka", "Gin", "Rum", "Tequila", "Brandy", "Liqueur", "Wine", "Beer", "Mezcal"]
+VOLUMES = [50, 375, 500, 700, 750, 1000, 1750]
+WORDS = ["Reserve", "Gold", "Silver", "Black", "Single Malt", "Aged", "Classic", "Spiced", "Blanco",
+         "Reposado", "Anejo", "Dry", "Smoked", "Cask", "Heritage", "Original", "Premium", "Select"]
+CHUNK = 20000
+
+
+def _insert(table, rows):
+    from models import db
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(table.insert(), rows[start:start + CHUNK])
+
+
+def check_target(config, force=False):
+    """Raise unless the configured database is safe to replace."""
+    if force:
+        return
+    if config["SQLALCHEMY_DATABASE_URI"] == config.get("DEFAULT_DATABASE_URI"):
+        raise RuntimeError(f"Refusing to replace the default database {config['SQLALCHEMY_DATABASE_URI']}; "
+                           "set DATABASE_URL or --database, or pass --force")
+    if config.get("TENANT_SHARDING") and config.get("TENANT_DATABASE_URL") == config.get("DEFAULT_TENANT_DATABASE_URL"):
+        raise RuntimeError(f"Refusing to replace the default shards {config['TENANT_DATABASE_URL']}; "
+                           "set TENANT_DATABASE_URL, or pass --force")
+
+
+def generate(orgs=1, products=200, days=90, seed=42, sold_ratio=0.2, adjusted_ratio=0.02,
+             price_changes=3, snapshot_days=30, today=None, force=False):
+    """Fill the app database; returns a dict of row counts."""
+    from flask import current_app
+    from werkzeug.security import generate_password_hash
+    from models import (db, Organization, User, Brand, AlcoholCategory, BottleVolume, Product, Stock,
+                        StockUpdate, Sale, Price)
+    from pricing import rebuild_current_prices
+    from sales_rollups import rebuild_sales_rollups
+    from stock_snapshots import backfill_snapshots
+    from search_index import rebuild_index
+    from reorder import rebuild_low_stock
+    from sharding import sharding_enabled, create_directory, drop_shards, known_shards, shard_scope, tenant_scope
+
+    check_target(current_app.config, force)
+    rng = random.Random(seed)
+    today = today or date.today()
+    first_day = today - timedelta(days=days - 1)
+    counts = {"products": 0, "sales": 0, "prices": 0, "stock_updates": 0}
+
+    if sharding_enabled():
+        drop_shards()
+    db.drop_all()
+    create_directory()
+
+    password_hash = generate_password_hash("benchmark")
+    _insert(Organization.__table__, [{"org_id": org_id, "org_name": f"Bench Bar {org_id}"}
+                                     for org_id in range(1, orgs + 1)])
+    _insert(User.__table__, [{
+        "user_id": org_id, "name": f"Admin {org_id}", "email": f"admin{org_id}@bench.local",
+        "password_hash": password_hash, "role": "admin", "org_id": org_id, "needs_password_change": False
+    } for org_id in range(1, orgs + 1)])
+    db.session.commit()
+
+    product_id = 0
+    without_reference = set(known_shards())  # Each shard has its own brands, categories and volumes
+    for org_id in range(1, orgs + 1):
+        with tenant_scope(org_id) as shard:
+            if shard in without_reference:
+                without_reference.discard(shard)
+                _insert(Brand.__table__, [{"brand_id": i + 1, "brand_name": f"Brand {i + 1:03d}"} for i in range(100)])
+                _insert(AlcoholCategory.__table__, [{"category_id": i + 1, "category_name": name}
+                                                    for i, name in enumerate(CATEGORIES)])
+                _insert(BottleVolume.__table__, [{"volume_id": i + 1, "volume_ml": ml} for i, ml in enumerate(VOLUMES)])
+
+            catalog = []
+            product_rows, stock_rows, price_rows = [], [], []
+            for i in range(products):
+                product_id += 1
+                brand_id = rng.randint(1, 100)
+                category_id = rng.randint(1, len(CATEGORIES))
+                product_rows.append({
+                    "product_id": product_id, "org_id": org_id, "brand_id": brand_id, "category_id": category_id,
+                    "volume_id": rng.randint(1, len(VOLUMES)),
+                    "product_name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i + 1}",
+                })
+                stock_rows.append({"product_id": product_id, "org_id": org_id, "quantity": rng.randint(0, 200),
+                                   "last_updated": datetime.combine(today, datetime.min.time())})
+
+                # Price timeline: an opening price before the first day plus a few changes
+                price = round(rng.uniform(8, 120), 2)
+                timeline = [(first_day - timedelta(days=1), price)]
+                for day in sorted(rng.sample(range(days), min(price_changes, days))):
+                    price = round(price * rng.uniform(0.9, 1.15), 2)
+                    timeline.append((first_day + timedelta(days=day), price))
+                for day, amount in timeline:
+                    price_rows.append({"product_id": product_id, "price": amount, "updated_by": org_id,
+                                       "effective_date": datetime.combine(day, datetime.min.time()) + timedelta(hours=9)})
+                catalog.append((product_id, timeline))
+
+            _insert(Product.__table__, product_rows)
+            _insert(Stock.__table__, stock_rows)
+            _insert(Price.__table__, price_rows)
+            counts["products"] += len(product_rows)
+            counts["prices"] += len(price_rows)
+
+            sale_rows, ledger_rows = [], []
+            sold_per_day = max(1, int(products * sold_ratio))
+            adjusted_per_day = max(1, int(products * adjusted_ratio))
+            cursor = {pid: 0 for pid, _ in catalog}
+            for offset in range(days):
+                day = first_day + timedelta(days=offset)
+                for pid, timeline in rng.sample(catalog, sold_per_day):
+                    while cursor[pid] + 1 < len(timeline) and timeline[cursor[pid] + 1][0] <= day:
+                        cursor[pid] += 1
+                    quantity = rng.randint(1, 6)
+                    sale_rows.append({"product_id": pid, "org_id": org_id, "quantity_sold": quantity,
+                                      "total_price": round(quantity * timeline[cursor[pid]][1], 2),
+                                      "sale_date": day, "sold_by": org_id,
+                                      "updated_at": datetime.combine(day, datetime.min.time()) + timedelta(hours=23)})
+                for pid, _ in rng.sample(catalog, adjusted_per_day):
+                    previous = rng.randint(0, 200)
+                    ledger_rows.append({"product_id": pid, "previous_quantity": previous,
+                                        "new_quantity": max(0, previous + rng.randint(-10, 24)), "updated_by": org_id,
+                                        "update_time": datetime.combine(day, datetime.min.time()) + timedelta(hours=18)})
+                if len(sale_rows) >= CHUNK:
+                    _insert(Sale.__table__, sale_rows)
+                    counts["sales"] += len(sale_rows)
+                    sale_rows = []
+            _insert(Sale.__table__, sale_rows)
+            _insert(StockUpdate.__table__, ledger_rows)
+            counts["sales"] += len(sale_rows)
+            counts["stock_updates"] += len(ledger_rows)
+            db.session.commit()
+
+    for org_id in range(1, orgs + 1):
+        with tenant_scope(org_id):
+            rebuild_current_prices(org_id)
+            rebuild_sales_rollups(org_id)
+            if snapshot_days:
+                backfill_snapshots(org_id, today - timedelta(days=snapshot_days - 1))
+            db.session.commit()
+    rebuild_low_stock()
+    for shard in known_shards():
+        with shard_scope(shard):
+            rebuild_index()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), help="preset for --orgs/--products/--days")
+    parser.add_argument("--orgs", type=int)
+    parser.add_argument("--products", type=int, help="products per org")
+    parser.add_argument("--days", type=int, help="days of sales history")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--sold-ratio", type=float, default=0.2, help="share of products sold each day")
+    parser.add_argument("--snapshot-days", type=int, default=30, help="days of stock snapshots to backfill")
+    parser.add_argument("--database", help="SQLite file to fill (default: DATABASE_URL)")
+    parser.add_argument("--force", action="store_true", help="allow replacing the app's default database")
+    args = parser.parse_args(argv)
+    if args.database:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(args.database)
+
+    params = dict(SCALES[args.scale or "small"])
+    for key in ("orgs", "products", "days"):
+        if getattr(args, key) is not None:
+            params[key] = getattr(args, key)
+
+    import config  # Checked before the app import, whose startup hooks already open the database
+    try:
+        check_target(vars(config), args.force)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    from app import app
+    started = time.perf_counter()
+    with app.app_context():
+        counts = generate(seed=args.seed, sold_ratio=args.sold_ratio, snapshot_days=args.snapshot_days,
+                          force=args.force, **params)
+    print(f"✅ Generated {counts} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""EXPLAIN QUERY PLAN over the SQL the blueprints issue, flagging full table scans.
+
+Fills a scratch SQLite file with generate_data.py (or, with --database, uses
+an existing one; its data is changed by the write routes). It then drives
+every benchmarked route plus the JSON API through the test client and
+records each distinct statement. Each statement is explained with the
+parameters it actually ran with. A plan step that reads a table without an
+index ("SCAN <table>") in a statement that filters (has a WHERE clause) is
+reported together with the routes that issued it. Unfiltered reads, such as
+loading every brand, are full reads by design. The exit status is 1 when
+any scan was found.
+
+    python benchmarks/index_advisor.py --scale small
+    python benchmarks/index_advisor.py --database /tmp/bench.db --json scans.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+from datetime import date
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+
+from generate_data import SCALES  # noqa: E402
+
+# "SCAN stock" is a full scan; "SCAN stock USING [COVERING] INDEX ..." walks an index
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+FILTERED = re.compile(r"\bWHERE\b", re.IGNORECASE)
+EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT INTO", "WITH")
+
+
+def _api_routes(today):
+    return [
+        ("api products", "GET", "/api/v1/products", None),
+        ("api prices", "GET", "/api/v1/prices", None),
+        ("api inventory", "GET", "/api/v1/inventory", None),
+        ("api sales", "GET", f"/api/v1/sales?date={today.isoformat()}", None),
+        ("api reorder", "GET", "/api/v1/reorder", None),
+        ("api changes", "GET", "/api/v1/changes", None),
+    ]
+
+
+def collect(routes, client, engine):
+    """Run each route once; returns {statement: {"params": first params, "routes": [names]}}."""
+    from sqlalchemy import event
+
+    statements = {}
+    current = [None]
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return
+        if executemany:
+            parameters = parameters[0] if parameters else ()
+        entry = statements.setdefault(statement, {"params": parameters, "routes": []})
+        if current[0] not in entry["routes"]:
+            entry["routes"].append(current[0])
+
+    try:
+        for i, (name, method, url, data) in enumerate(routes):
+            current[0] = name
+            kwargs = {}
+            if data is not None:
+                kwargs["data"] = data(i)
+                if name == "catalog upload":
+                    kwargs["content_type"] = "multipart/form-data"
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            if response.status_code >= 400:
+                print(f"⚠️ {name}: HTTP {response.status_code}")
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+    return statements
+
+
+def explain(statements, engine):
+    """[(statement, routes, plan, scanned tables)] for every recorded statement."""
+    from sqlalchemy import inspect
+
+    tables = set(inspect(engine).get_table_names())
+    findings = []
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        for statement, entry in statements.items():
+            try:
+                plan = [row[3] for row in raw.execute(f"EXPLAIN QUERY PLAN {statement}", entry["params"])]
+            except Exception as e:  # e.g. statements on the FTS table
+                plan = [f"(not explained: {e})"]
+            scans = sorted({
+                match.group(1) for step in plan for match in [FULL_SCAN.match(step)]
+                if match and match.group(1) in tables
+            }) if FILTERED.search(statement) else []
+            findings.append((statement, entry["routes"], plan, scans))
+    return findings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--database", help="existing SQLite file to analyze instead of generating one")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--all", action="store_true", help="print every plan, not just the scans")
+    parser.add_argument("--json", help="write the findings to this file")
+    args = parser.parse_args(argv)
+
+    scratch = None
+    os.environ["TENANT_SHARDING"] = ""  # Shards share the schema; one database shows every plan
+    if args.database:
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(args.database)
+    else:
+        scratch = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        scratch.close()
+        os.environ["DATABASE_URL"] = "sqlite:///" + scratch.name
+
+    try:
+        from app import app
+        from models import db, Product, User
+        from bench_routes import _routes
+
+        app.config["TESTING"] = True
+        with app.app_context():
+            if scratch:
+                from generate_data import generate
+                generate(seed=args.seed, **SCALES[args.scale])
+            admin = User.query.filter_by(role="admin").order_by(User.user_id).first()
+            product_ids = [pid for (pid,) in db.session.query(Product.product_id)
+                           .filter(Product.org_id == admin.org_id).order_by(Product.product_id)]
+            engine = db.engine
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["_user_id"] = str(admin.user_id)  # Flask-Login's session key; skips password hashing
+        today = date.today()
+        with app.app_context():
+            statements = collect(_routes(product_ids, today) + _api_routes(today), client, engine)
+            findings = explain(statements, engine)
+    finally:
+        if scratch:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(scratch.name + suffix):
+                    os.remove(scratch.name + suffix)
+
+    flagged = [finding for finding in findings if finding[3]]
+    for statement, routes, plan, scans in findings:
+        if not scans and not args.all:
+            continue
+        print(f"\n{'❌ SCAN ' + ', '.join(scans) if scans else '✅'}  ({', '.join(routes)})")
+        print("   " + " ".join(statement.split())[:300])
+        for step in plan:
+            print(f"     {step}")
+    print(f"\n{len(findings)} statements explained, {len(flagged)} with full table scans.")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([{"statement": statement, "routes": routes, "plan": plan, "scans": scans}
+                       for statement, routes, plan, scans in findings], f, indent=2)
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from models import db, Product, Brand, AlcoholCategory, BottleVolume
+from pricing import current_prices
+from sharding import current_shard
+
+# Read-through cache for reference tables (brands, categories, volumes) and
+# per-org product catalogs. Entries are keyed by a catalog version that the
+# admin routes bump on every add/edit/delete/upload, so a bump makes the old
+# entries unreachable and LRU eviction reclaims them. Versions live in this
+# worker only; the TTL bounds how long another worker can serve a stale list.
+# Each tenant shard has its own reference tables, so those are cached per shard.
+# Cached values are plain rows and dicts, never session-bound ORM objects.
+
+_REFERENCE = "reference"
+
+
+class LRUCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_cache = LRUCache()
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def catalog_version(scope):
+    return _versions.get(scope, 0)
+
+
+def bump_catalog_version(org_id):
+    """Invalidate an org's catalog and the shared reference lists."""
+    with _versions_lock:
+        for scope in (org_id, _REFERENCE):
+            _versions[scope] = _versions.get(scope, 0) + 1
+
+
+def _read_through(key, loader):
+    value = _cache.get(key)
+    if value is None:
+        value = loader()
+        _cache.maxsize = current_app.config.get("CATALOG_CACHE_SIZE", _cache.maxsize)
+        _cache.put(key, value, current_app.config.get("CATALOG_CACHE_TTL", 30))
+    return value
+
+
+def get_reference_data():
+    """Brands, categories and volumes as (brands, categories, volumes) row lists."""
+    def load():
+        brands = db.session.query(Brand.brand_id, Brand.brand_name).order_by(Brand.brand_name).all()
+        categories = (
+            db.session.query(AlcoholCategory.category_id, AlcoholCategory.category_name)
+            .order_by(AlcoholCategory.category_name).all()
+        )
+        volumes = db.session.query(BottleVolume.volume_id, BottleVolume.volume_ml).order_by(BottleVolume.volume_ml).all()
+        return brands, categories, volumes
+
+    return _read_through((_REFERENCE, current_shard(), catalog_version(_REFERENCE)), load)
+
+
+def get_org_catalog(org_id):
+    """An org's products joined with brand/category/volume names and current price."""
+    def load():
+        prices = current_prices(org_id)
+        rows = (
+            db.session.query(
+                Product.product_id, Product.product_name, Product.brand_id, Product.category_id,
+                Product.volume_id, Product.reorder_point, Brand.brand_name, AlcoholCategory.category_name, BottleVolume.volume_ml
+            )
+            .join(Brand, Brand.brand_id == Product.brand_id)
+            .join(AlcoholCategory, AlcoholCategory.category_id == Product.category_id)
+            .join(BottleVolume, BottleVolume.volume_id == Product.volume_id)
+            .filter(Product.org_id == org_id)
+            .order_by(Product.product_name)
+        )
+        return [dict(row._asdict(), price=prices.get(row.product_id)) for row in rows]
+
+    return _read_through(("catalog", org_id, catalog_version(org_id)), load)
+
+
+def cache_stats():
+    return {"hits": _cache.hits, "misses": _cache.misses, "entries": len(_cache), "maxsize": _cache.maxsize}
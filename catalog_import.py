@@ -0,0 +1,171 @@
+import csv
+import time
+from models import db, Product, Brand, AlcoholCategory, BottleVolume
+from pricing import set_initial_prices
+from search_index import index_products
+from page_cache import bump_org_version
+from reorder import refresh_low_stock
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 5000  # Each chunk is one write transaction holding the SQLite write lock
+
+
+def _load_dimensions(org_id):
+    """Preload brands, categories, volumes and the org's catalog keys into dicts."""
+    brands = dict(db.session.query(Brand.brand_name, Brand.brand_id))
+    categories = dict(db.session.query(AlcoholCategory.category_name, AlcoholCategory.category_id))
+    volumes = dict(db.session.query(BottleVolume.volume_ml, BottleVolume.volume_id))
+    existing = set(
+        db.session.query(Product.product_name, Product.brand_id, Product.category_id, Product.volume_id)
+        .filter(Product.org_id == org_id)
+    )
+    return brands, categories, volumes, existing
+
+
+def _ensure(model, key_attr, id_attr, cache, keys):
+    """Bulk-insert dimension values missing from ``cache`` and record their ids."""
+    missing = [key for key in dict.fromkeys(keys) if key not in cache]
+    if not missing:
+        return 0
+    db.session.bulk_insert_mappings(model, [{key_attr: key} for key in missing])
+    key_col, id_col = getattr(model, key_attr), getattr(model, id_attr)
+    cache.update(db.session.query(key_col, id_col).filter(key_col.in_(missing)))
+    return len(missing)
+
+
+def _diff_chunk(chunk, brands, categories, volumes, existing, summary):
+    """Dry-run counterpart of _apply_chunk: count what would be written."""
+    new_keys = 0
+    for name, ml, category_name in chunk:
+        for cache, key, label in ((brands, name, "new_brands"), (categories, category_name, "new_categories"),
+                                  (volumes, ml, "new_volumes")):
+            if key not in cache:
+                cache[key] = None
+                summary[label] += 1
+        key = (name, ml, category_name)
+        if key in existing:
+            continue
+        existing.add(key)
+        new_keys += 1
+    return new_keys
+
+
+def _apply_chunk(chunk, org_id, user_id, brands, categories, volumes, existing, summary):
+    summary["new_brands"] += _ensure(Brand, "brand_name", "brand_id", brands, (name for name, _, _ in chunk))
+    summary["new_categories"] += _ensure(AlcoholCategory, "category_name", "category_id", categories,
+                                         (cat for _, _, cat in chunk))
+    summary["new_volumes"] += _ensure(BottleVolume, "volume_ml", "volume_id", volumes, (ml for _, ml, _ in chunk))
+
+    new_keys = []
+    for name, ml, category_name in chunk:
+        key = (name, brands[name], categories[category_name], volumes[ml])
+        if key in existing:
+            continue
+        existing.add(key)
+        new_keys.append(key)
+
+    if new_keys:
+        db.session.bulk_insert_mappings(Product, [
+            {"product_name": name, "brand_id": brand_id, "category_id": category_id,
+             "volume_id": volume_id, "org_id": org_id}
+            for name, brand_id, category_id, volume_id in new_keys
+        ])
+        wanted = set(new_keys)
+        inserted = (
+            db.session.query(Product.product_id, Product.product_name, Product.brand_id,
+                             Product.category_id, Product.volume_id)
+            .filter(Product.org_id == org_id, Product.product_name.in_({key[0] for key in new_keys}))
+        )
+        new_ids = [product_id for product_id, *key in inserted if tuple(key) in wanted]
+        set_initial_prices(new_ids, org_id, 0.00, user_id)
+        index_products(new_ids)
+        refresh_low_stock(org_id, new_ids)  # New products start with no stock
+        bump_org_version(org_id)
+    db.session.commit()
+    return len(new_keys)
+
+
+def import_catalog(lines, org_id, user_id=None, chunk_size=DEFAULT_CHUNK_SIZE, normalize_category=str.strip,
+                   dry_run=False):
+    """Stream a Name/ML/Category CSV into an org's product catalog.
+
+    ``lines`` is any iterable of text lines (an open file, a decoded upload
+    stream). Dimension lookups go through in-memory maps preloaded once, rows
+    are diffed against the org's catalog by natural key, and inserts are
+    applied in chunks of ``chunk_size`` (clamped to 1..MAX_CHUNK_SIZE) with
+    a commit per chunk. A chunk that fails is rolled back and counted as
+    failed, and the import carries on with the next one; a stream that cannot
+    be read any further stops the import after flushing what was read. Either
+    way the last error is kept in ``summary["error"]``.
+
+    With ``dry_run`` nothing is written; ``inserted`` and the ``new_*``
+    counters then describe the diff that would be applied.
+
+    Returns a summary dict with inserted/skipped/failed/rows counts, elapsed
+    seconds and rows_per_sec.
+    """
+    started = time.perf_counter()
+    chunk_size = max(1, min(chunk_size, MAX_CHUNK_SIZE))
+    brands, categories, volumes, existing = _load_dimensions(org_id)
+    summary = {"rows": 0, "inserted": 0, "skipped": 0, "failed": 0,
+               "new_brands": 0, "new_categories": 0, "new_volumes": 0}
+
+    if dry_run:
+        # Compare on the natural values so unseen dimensions still match up
+        id_to_brand = {v: k for k, v in brands.items()}
+        id_to_category = {v: k for k, v in categories.items()}
+        id_to_volume = {v: k for k, v in volumes.items()}
+        existing = {(name, id_to_volume[volume_id], id_to_category[category_id])
+                    for name, brand_id, category_id, volume_id in existing
+                    if id_to_brand.get(brand_id) == name}
+
+    def flush(chunk):
+        if dry_run:
+            inserted = _diff_chunk(chunk, brands, categories, volumes, existing, summary)
+        else:
+            counted = {label: summary[label] for label in ("new_brands", "new_categories", "new_volumes")}
+            try:
+                inserted = _apply_chunk(chunk, org_id, user_id, brands, categories, volumes, existing, summary)
+            except Exception as e:
+                # Earlier chunks stay committed; drop this one and reload the maps it may have filled
+                db.session.rollback()
+                print(f"[Catalog Import Error] {len(chunk)} row(s) not imported: {e}")
+                summary.update(counted)
+                summary["failed"] += len(chunk)
+                summary["error"] = str(e)
+                for cache, fresh in zip((brands, categories, volumes, existing), _load_dimensions(org_id)):
+                    cache.clear()
+                    cache.update(fresh)
+                return
+        summary["inserted"] += inserted
+        summary["skipped"] += len(chunk) - inserted
+
+    chunk = []
+    try:
+        for row in csv.DictReader(lines):
+            summary["rows"] += 1
+            try:
+                name = row["Name"].strip()
+                ml = int(row["ML"].strip())
+                category_name = normalize_category(row["Category"])
+            except (KeyError, AttributeError, ValueError):
+                summary["failed"] += 1
+                continue
+            if not name or not category_name:
+                summary["failed"] += 1
+                continue
+
+            chunk.append((name, ml, category_name))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        print(f"[Catalog Import Error] Stopped reading after {summary['rows']} row(s): {e}")
+        summary["error"] = f"stopped reading after {summary['rows']} row(s): {e}"
+
+    if chunk:
+        flush(chunk)
+
+    summary["elapsed"] = time.perf_counter() - started
+    summary["rows_per_sec"] = summary["rows"] / summary["elapsed"] if summary["elapsed"] else 0.0
+    return summary
@@ -0,0 +1,63 @@
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+
+# Engine tuning shared by the app, db_init and the benchmarks. SQLite gets
+# WAL journaling, a busy timeout and larger page/mmap caches via PRAGMAs on
+# every new connection; server databases (DATABASE_URL) get pool sizing and
+# pre-ping. All values come from config.py, which reads the environment.
+
+_sqlite_pragmas = []
+
+
+def sqlite_pragmas(config):
+    pragmas = [
+        ("journal_mode", config.get("SQLITE_JOURNAL_MODE", "WAL")),
+        ("synchronous", config.get("SQLITE_SYNCHRONOUS", "NORMAL")),
+        ("busy_timeout", int(config.get("SQLITE_BUSY_TIMEOUT_MS", 15000))),
+        # Negative cache_size is in KiB rather than pages
+        ("cache_size", -int(config.get("SQLITE_CACHE_SIZE_KB", 65536))),
+        ("mmap_size", int(config.get("SQLITE_MMAP_SIZE_MB", 256)) * 1024 * 1024),
+        ("temp_store", "MEMORY"),
+    ]
+    return [(name, value) for name, value in pragmas if value not in (None, "")]
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URI."""
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    options = {"pool_pre_ping": bool(config.get("DB_POOL_PRE_PING", True))}
+
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:"):
+            return options  # In-memory databases use a single static connection
+        options["connect_args"] = {
+            "timeout": int(config.get("SQLITE_BUSY_TIMEOUT_MS", 15000)) / 1000,
+            "check_same_thread": False,
+        }
+    else:
+        options["pool_recycle"] = int(config.get("DB_POOL_RECYCLE", 1800))
+
+    options["pool_size"] = int(config.get("DB_POOL_SIZE", 10))
+    options["max_overflow"] = int(config.get("DB_MAX_OVERFLOW", 20))
+    options["pool_timeout"] = int(config.get("DB_POOL_TIMEOUT", 30))
+    return options
+
+
+def configure_engine(app):
+    """Fill in engine options and SQLite PRAGMAs; call before db.init_app."""
+    options = engine_options(app.config)
+    options.update(app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    _sqlite_pragmas[:] = sqlite_pragmas(app.config)
+
+
+@event.listens_for(Engine, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not _sqlite_pragmas:
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _sqlite_pragmas:
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
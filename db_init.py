@@ -1,18 +1,23 @@
 from flask import Flask
-from config import SQLALCHEMY_DATABASE_URI, SQLALCHEMY_TRACK_MODIFICATIONS
 from models import db
+from db_engine import configure_engine
+from search_index import rebuild_index
+from sharding import sharding_enabled, create_directory, drop_shards
 
 app = Flask(__name__)
 
-# Configure the SQLite database
-app.config["SQLALCHEMY_DATABASE_URI"] = SQLALCHEMY_DATABASE_URI
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = SQLALCHEMY_TRACK_MODIFICATIONS
+# Configure the database (URI, engine options and SQLite PRAGMAs from config.py)
+app.config.from_object('config')
+configure_engine(app)
 
 # Initialize Database
 db.init_app(app)
 
 # Create Tables
 with app.app_context():
+    if sharding_enabled():
+        drop_shards()  # Tenant databases are found through the organizations table, so first
     db.drop_all()  # Drop all tables to ensure a clean slate
-    db.create_all()  # Create all tables based on the models
+    create_directory()  # Create all tables based on the models (the directory's only, when sharded)
+    rebuild_index()  # The FTS table is not part of the models, so clear it explicitly
     print("📦 Database and tables created successfully!")
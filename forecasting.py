@@ -0,0 +1,213 @@
+from datetime import date, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from catalog_cache import LRUCache
+from models import db, Product, Stock, Sale, SalesRollup
+from page_cache import org_version
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - forecasting_available() reports it
+    np = None
+
+# Demand forecasts and suggested distributor orders. Everything is computed
+# over dense arrays instead of per-product loops:
+#
+#   * Day-of-week seasonality per category comes from FORECAST_HISTORY_DAYS
+#     of daily category rollups (a category x day matrix), shrunk towards the
+#     org-wide weekly profile for categories with little history.
+#   * Each product's sales over the last FORECAST_WINDOW_DAYS are loaded as a
+#     product x day matrix. The 7- and 28-day moving averages are divided by
+#     the seasonal factors of the days they cover, which gives a
+#     deseasonalized daily rate.
+#   * The rate times the factors of the coming days forecasts demand. Stock
+#     against the running sum of that forecast gives days of cover. Demand
+#     over lead time plus review period, plus safety stock, less stock on
+#     hand gives the suggested order.
+#
+# The per-org model is cached under the org's change version (see
+# page_cache.py), so it is rebuilt after the next stock or sales write.
+# Order suggestions for a given lead time are cheap and are computed from it
+# on every request.
+
+SHORT_DAYS = 7
+SHORT_WEIGHT = 0.3  # Share of the 7-day average in the blended rate, the rest is the window average
+PRIOR_UNITS = 50  # Units of category history at which its own weekly profile gets half the weight
+COVER_HORIZON_DAYS = 120
+
+_models = LRUCache(maxsize=64)
+
+
+def forecasting_available():
+    return np is not None
+
+
+def _weekdays(first_day, days):
+    return (np.arange(days) + first_day.weekday()) % 7
+
+
+def _lookup(sorted_ids, ids):
+    """Positions of ``ids`` in ``sorted_ids`` and a mask of the ids found there.
+
+    Sales and rollups can refer to products or categories the org no longer
+    has (deleted products keep their sales), so unknown ids are masked out.
+    """
+    index = np.searchsorted(sorted_ids, ids)
+    if not len(sorted_ids):
+        return index, np.zeros(len(ids), dtype=bool)
+    known = (index < len(sorted_ids)) & (sorted_ids[np.minimum(index, len(sorted_ids) - 1)] == ids)
+    return index, known
+
+
+def _weekly_profiles(org_id, category_ids, today, history_days):
+    """Category x weekday seasonal factors (mean 1) from the daily category rollups."""
+    if not len(category_ids):
+        return np.ones((0, 7))
+    first_day = today - timedelta(days=history_days)
+    rows = db.session.execute(
+        select(SalesRollup.period_start, SalesRollup.dimension_id, SalesRollup.units)
+        .where(SalesRollup.org_id == org_id, SalesRollup.period == "day",
+               SalesRollup.period_start >= first_day, SalesRollup.period_start < today,
+               SalesRollup.dimension == "category")
+    ).all()
+
+    totals = np.zeros((len(category_ids), history_days))
+    if rows:
+        days = np.fromiter(((start - first_day).days for start, _, _ in rows), dtype=np.int64, count=len(rows))
+        dims = np.fromiter((dimension_id for _, dimension_id, _ in rows), dtype=np.int64, count=len(rows))
+        units = np.fromiter((units for _, _, units in rows), dtype=np.float64, count=len(rows))
+        index, known = _lookup(category_ids, dims)
+        np.add.at(totals, (index[known], days[known]), units[known])
+
+    weekday_of = np.eye(7)[_weekdays(first_day, history_days)]  # day x weekday one-hot
+    per_weekday = totals @ weekday_of / np.maximum(weekday_of.sum(axis=0), 1)
+
+    def profile(means):
+        overall = means.mean(axis=-1, keepdims=True)
+        return np.divide(means, overall, out=np.ones_like(means), where=overall > 0)
+
+    org_profile = profile(per_weekday.sum(axis=0))
+    weight = totals.sum(axis=1, keepdims=True)
+    weight = weight / (weight + PRIOR_UNITS)
+    return weight * profile(per_weekday) + (1 - weight) * org_profile
+
+
+def build_model(org_id, today=None):
+    """Per-product rates, volatility, seasonal factors and stock for an org, as arrays."""
+    config = current_app.config
+    today = today or date.today()
+    window = config.get("FORECAST_WINDOW_DAYS", 28)
+    history_days = config.get("FORECAST_HISTORY_DAYS", 730)
+
+    levels = (
+        select(Stock.product_id, func.sum(Stock.quantity).label("quantity"))
+        .where(Stock.org_id == org_id).group_by(Stock.product_id).subquery()
+    )
+    products = db.session.execute(
+        select(Product.product_id, Product.category_id, func.coalesce(levels.c.quantity, 0))
+        .outerjoin(levels, levels.c.product_id == Product.product_id)
+        .where(Product.org_id == org_id)
+        .order_by(Product.product_id)
+    ).all()
+    count = len(products)
+    product_ids = np.fromiter((row[0] for row in products), dtype=np.int64, count=count)
+    product_categories = np.fromiter((row[1] for row in products), dtype=np.int64, count=count)
+    stock = np.fromiter((row[2] for row in products), dtype=np.float64, count=count)
+    category_ids, category_index = np.unique(product_categories, return_inverse=True)
+
+    # Product x day matrix of units sold over the window, ending yesterday
+    first_day = today - timedelta(days=window)
+    sales = db.session.execute(
+        select(Sale.product_id, Sale.sale_date, Sale.quantity_sold)
+        .where(Sale.org_id == org_id, Sale.sale_date >= first_day, Sale.sale_date < today)
+    ).all()
+    sold = np.zeros(count * window)
+    if sales and count:
+        rows, known = _lookup(product_ids, np.fromiter((row[0] for row in sales), dtype=np.int64, count=len(sales)))
+        days = np.fromiter(((row[1] - first_day).days for row in sales), dtype=np.int64, count=len(sales))
+        units = np.fromiter((row[2] for row in sales), dtype=np.float64, count=len(sales))
+        sold = np.bincount(rows[known] * window + days[known], weights=units[known], minlength=count * window)
+    sold = sold.reshape(count, window)
+
+    profiles = _weekly_profiles(org_id, category_ids, today, history_days)[category_index]  # product x weekday
+    seasonal = profiles[:, _weekdays(first_day, window)]  # product x day
+
+    def rate(days):
+        expected = seasonal[:, -days:].sum(axis=1)
+        return np.divide(sold[:, -days:].sum(axis=1), expected, out=np.zeros(count), where=expected > 0)
+
+    short = min(SHORT_DAYS, window)
+    base = SHORT_WEIGHT * rate(short) + (1 - SHORT_WEIGHT) * rate(window)
+    residual = sold - base[:, None] * seasonal
+    return {
+        "today": today,
+        "product_ids": product_ids,
+        "stock": stock,
+        "average_short": sold[:, -short:].mean(axis=1),
+        "average_window": sold.mean(axis=1),
+        "rate": base,
+        "sigma": residual.std(axis=1),
+        "profiles": profiles,
+    }
+
+
+def org_model(org_id):
+    """The org's model, rebuilt once per change version."""
+    version, _ = org_version(org_id)
+    key = (org_id, version, date.today())
+    model = _models.get(key)
+    if model is None:
+        model = build_model(org_id, key[2])
+        _models.put(key, model, current_app.config.get("FORECAST_CACHE_TTL", 3600))
+    return model
+
+
+def suggest_orders(model, lead_days, review_days, service_z):
+    """Forecast demand, days of cover and suggested order quantity per product."""
+    horizon = max(COVER_HORIZON_DAYS, lead_days + review_days)
+    forecast = model["rate"][:, None] * model["profiles"][:, _weekdays(model["today"], horizon)]
+    cumulative = np.cumsum(forecast, axis=1)
+    stock = np.maximum(model["stock"], 0)
+
+    runs_out = cumulative >= stock[:, None]
+    covered = runs_out.any(axis=1) & (model["rate"] > 0)
+    days_of_cover = np.where(covered, runs_out.argmax(axis=1), -1)
+
+    lead_demand = cumulative[:, lead_days - 1] if lead_days else np.zeros(len(stock))
+    cycle_demand = cumulative[:, lead_days + review_days - 1] if lead_days + review_days else np.zeros(len(stock))
+    safety = service_z * model["sigma"] * np.sqrt(max(lead_days, 1))
+    suggested = np.ceil(np.maximum(cycle_demand + safety - model["stock"], 0))
+    return {
+        "product_id": model["product_ids"],
+        "stock": model["stock"],
+        "average_daily_7": model["average_short"],
+        "average_daily_window": model["average_window"],
+        "forecast_daily": model["rate"],
+        "days_of_cover": days_of_cover,
+        "lead_time_demand": lead_demand,
+        "safety_stock": safety,
+        "suggested_order": suggested,
+    }
+
+
+def order_suggestions(model, lead_days, review_days, service_z, include_all=False):
+    """suggest_orders as rows, soonest stock-out first; products without demand go last."""
+    columns = suggest_orders(model, lead_days, review_days, service_z)
+    cover = columns["days_of_cover"]
+    selected = np.arange(len(cover)) if include_all else columns["suggested_order"].nonzero()[0]
+    order = selected[np.lexsort((cover[selected], cover[selected] < 0))]
+
+    for name in ("average_daily_7", "average_daily_window", "forecast_daily", "lead_time_demand", "safety_stock"):
+        columns[name] = columns[name].round(2)
+    columns["stock"] = columns["stock"].astype(np.int64)
+    columns["suggested_order"] = columns["suggested_order"].astype(np.int64)
+    picked = {name: values[order].tolist() for name, values in columns.items()}
+    rows = [dict(zip(picked, values)) for values in zip(*picked.values())]
+    for row in rows:
+        if row["days_of_cover"] < 0:
+            row["days_of_cover"] = None
+    return rows
+
+
+def forecast_stats():
+    return {"hits": _models.hits, "misses": _models.misses, "entries": len(_models), "maxsize": _models.maxsize}
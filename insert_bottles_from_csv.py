@@ -1,64 +1,52 @@
-import csv
-from models import db, Brand, BottleVolume, AlcoholCategory, Product
-from sqlalchemy.exc import IntegrityError
+import argparse
+import sys
+from catalog_import import import_catalog, DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
+from models import Organization
+from sharding import tenant_scope
+
+
+def insert_bottles_from_csv(csv_path, org_id, batch_size=DEFAULT_CHUNK_SIZE, dry_run=False):
+    if Organization.query.get(org_id) is None:
+        print(f"❌ Organization {org_id} does not exist.")
+        return None
+
+    with open(csv_path, newline='', encoding='utf-8-sig') as csvfile, tenant_scope(org_id):
+        summary = import_catalog(
+            csvfile,
+            org_id,
+            chunk_size=batch_size,
+            normalize_category=lambda name: name.strip().capitalize(),
+            dry_run=dry_run
+        )
+
+    prefix = "🔍 Dry run:" if dry_run else "✅ Loaded:"
+    print(f"{prefix} {summary['rows']} rows -> {summary['inserted']} new products, "
+          f"{summary['skipped']} already present, {summary['failed']} failed")
+    print(f"   new brands: {summary['new_brands']}, new categories: {summary['new_categories']}, "
+          f"new volumes: {summary['new_volumes']}")
+    print(f"   {summary['elapsed']:.2f}s, {summary['rows_per_sec']:.0f} rows/s")
+    if summary.get("error"):
+        print(f"⚠️ Last error: {summary['error']}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load a Name/ML/Category bottle catalog into an organization.")
+    parser.add_argument("org_id", type=int, help="target organization id")
+    parser.add_argument("csv_path", nargs="?", default="bottles.csv", help="catalog CSV (default: bottles.csv)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f"rows per insert batch / transaction (default: {DEFAULT_CHUNK_SIZE})")
+    parser.add_argument("--dry-run", action="store_true", help="report the diff without writing anything")
+    args = parser.parse_args(argv)
+    if not 1 <= args.batch_size <= MAX_CHUNK_SIZE:
+        parser.error(f"--batch-size must be between 1 and {MAX_CHUNK_SIZE}")
 
-def insert_bottles_from_csv(csv_path):
-    with open(csv_path, newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        print("CSV Headers:", reader.fieldnames)  # Add this line
-
-        for row in reader:
-            name = row["Name"].strip()
-            volume_ml = int(row["ML"])
-            category_name = row["Category"].strip().capitalize()
-
-            # 1. Add or fetch category
-            category = AlcoholCategory.query.filter_by(category_name=category_name).first()
-            if not category:
-                category = AlcoholCategory(category_name=category_name)
-                db.session.add(category)
-                db.session.commit()
-
-            # 2. Add or fetch volume
-            volume = BottleVolume.query.filter_by(volume_ml=volume_ml).first()
-            if not volume:
-                volume = BottleVolume(volume_ml=volume_ml)
-                db.session.add(volume)
-                db.session.commit()
-
-            # 3. Add or fetch brand
-            brand = Brand.query.filter_by(brand_name=name).first()
-            if not brand:
-                brand = Brand(brand_name=name)
-                db.session.add(brand)
-                db.session.commit()
-
-            # 4. Add product (if not exists)
-            product_exists = Product.query.filter_by(
-                product_name=name,
-                brand_id=brand.brand_id,
-                category_id=category.category_id,
-                volume_id=volume.volume_id
-            ).first()
-
-            if not product_exists:
-                product = Product(
-                    product_name=name,
-                    brand_id=brand.brand_id,
-                    category_id=category.category_id,
-                    volume_id=volume.volume_id
-                )
-                db.session.add(product)
+    from app import app  # or from your Flask project entry point
+    with app.app_context():
+        summary = insert_bottles_from_csv(args.csv_path, args.org_id, args.batch_size, args.dry_run)
+    return 0 if summary is not None else 1
 
-    try:
-        db.session.commit()
-        print("✅ All bottles inserted successfully.")
-    except IntegrityError as e:
-        db.session.rollback()
-        print("❌ Integrity Error:", e)
 
-# Usage
+# Usage: python insert_bottles_from_csv.py <org_id> [bottles.csv] [--batch-size N] [--dry-run]
 if __name__ == "__main__":
-    from app import app  # or from your Flask project entry point
-    with app.app_context():
-        insert_bottles_from_csv("bottles.csv")
+    sys.exit(main())
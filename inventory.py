@@ -1,44 +1,246 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
-from models import db, Stock, Product, Brand, AlcoholCategory, StockUpdate
-from datetime import datetime
-from sqlalchemy.orm import joinedload
+from models import db, Stock, Product, Brand, AlcoholCategory, BottleVolume, StockUpdate
+from datetime import datetime, date
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import IntegrityError
+from search_index import search_matches
+from catalog_cache import get_reference_data
+from stock_snapshots import record_stock_changes
+from page_cache import bump_org_version, conditional_page
+from reorder import refresh_low_stock, effective_reorder_point, category_points, is_critical
+import base64
+import json
+import time
 
 inventory_bp = Blueprint('inventory', __name__)
 
+def apply_stock_quantities(org_id, user_id, quantities):
+    """Set stock levels for many products at once.
+
+    ``quantities`` maps product_id -> new quantity. Products outside the org
+    are ignored and rows whose quantity is unchanged are left alone. Returns
+    ``(changed_count, elapsed_ms)``; the caller commits.
+    """
+    started = time.perf_counter()
+    if not quantities:
+        return 0, 0.0
+
+    # 🔒 One IN (...) query for ownership, one for the current stock rows
+    owned_ids = {
+        product_id for (product_id,) in db.session.query(Product.product_id)
+        .filter(Product.org_id == org_id, Product.product_id.in_(quantities.keys()))
+    }
+    stocks = {
+        stock.product_id: stock for stock in Stock.query
+        .filter(Stock.org_id == org_id, Stock.product_id.in_(owned_ids))
+    } if owned_ids else {}
+
+    now = datetime.now()
+    stock_updates, stock_inserts, ledger = [], [], []
+    for product_id in owned_ids:
+        new_quantity = quantities[product_id]
+        stock = stocks.get(product_id)
+        previous_quantity = stock.quantity if stock else 0
+
+        if stock:
+            if stock.quantity == new_quantity:
+                continue
+            stock_updates.append({
+                "stock_id": stock.stock_id,
+                "quantity": new_quantity,
+                "last_updated": now,
+                "last_updated_by": user_id
+            })
+        else:
+            if new_quantity == 0:
+                continue
+            stock_inserts.append({
+                "product_id": product_id,
+                "org_id": org_id,
+                "quantity": new_quantity,
+                "last_updated": now,
+                "last_updated_by": user_id
+            })
+
+        ledger.append({
+            "product_id": product_id,
+            "previous_quantity": previous_quantity,
+            "new_quantity": new_quantity,
+            "updated_by": user_id
+        })
+
+    if stock_updates:
+        db.session.bulk_update_mappings(Stock, stock_updates)
+    if stock_inserts:
+        db.session.bulk_insert_mappings(Stock, stock_inserts)
+    if ledger:
+        db.session.bulk_insert_mappings(StockUpdate, ledger)
+        record_stock_changes(org_id, date.today(), {
+            entry["product_id"]: (entry["previous_quantity"], entry["new_quantity"], 0) for entry in ledger
+        })
+        refresh_low_stock(org_id, [entry["product_id"] for entry in ledger])
+        bump_org_version(org_id)
+
+    return len(ledger), (time.perf_counter() - started) * 1000
+
+
+def save_stock_quantities(org_id, user_id, quantities):
+    """apply_stock_quantities and commit; ``elapsed_ms`` includes the commit, where SQLite holds the write lock.
+
+    A concurrent request can create a missing stock row between our read and
+    our insert; uq_stock_org_product then rejects ours. Retry once, which sees
+    that row and updates it instead.
+    """
+    started = time.perf_counter()
+    try:
+        changed, _ = apply_stock_quantities(org_id, user_id, quantities)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        changed, _ = apply_stock_quantities(org_id, user_id, quantities)
+        db.session.commit()
+    return changed, (time.perf_counter() - started) * 1000
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+NEVER_UPDATED = "1970-01-01 00:00:00"
+
+# sort key -> column expression; product_id is always the tiebreaker
+SORT_COLUMNS = {
+    "name": Product.product_name,
+    "brand": Brand.brand_name,
+    "category": AlcoholCategory.category_name,
+    "quantity": func.coalesce(Stock.quantity, 0),
+    # Compared as the stored text so cursors round-trip exactly
+    "updated": func.coalesce(Stock.last_updated, NEVER_UPDATED, type_=db.String),
+}
+
+
+def encode_cursor(value, product_id):
+    raw = json.dumps([value, product_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    value, product_id = json.loads(raw)
+    return value, int(product_id)
+
+
 @inventory_bp.route("/inventory", methods=["GET"])
 @login_required
+@conditional_page
 def inventory():
     org_id = current_user.org_id  # Get user's organization
 
-    brands = Brand.query.all()
-    categories = AlcoholCategory.query.all()
+    brands, categories, _ = get_reference_data()
 
     search = request.args.get("search", "")
     category_id = request.args.get("category", "")
     brand_id = request.args.get("brand", "")
+    descending = request.args.get("dir") == "desc"
+    per_page = request.args.get("per_page", DEFAULT_PAGE_SIZE, type=int)
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    cursor = request.args.get("after", "")
+    # A "before" cursor pages backwards: scan the other way from it, then flip the rows
+    backwards = not cursor and bool(request.args.get("before"))
+    if backwards:
+        cursor = request.args.get("before")
 
-    query = db.session.query(Product).options(
-        joinedload(Product.brand),
-        joinedload(Product.category),
-        joinedload(Product.volume),
-        joinedload(Product.stock)
-    ).filter(Product.org_id == org_id)  # 🔒 Filter by org_id
-
+    filters = [Product.org_id == org_id]  # 🔒 Filter by org_id
+    sort_columns = SORT_COLUMNS
+    matches = None
     if search:
-        query = query.filter(Product.product_name.ilike(f"%{search}%"))
+        matches = search_matches(org_id, search)
+        if matches is None:
+            filters.append(Product.product_name.ilike(f"%{search}%"))
+        else:
+            # The bm25 rank from the search index doubles as a keyset sort column
+            sort_columns = dict(SORT_COLUMNS, relevance=matches.c.rank)
     if category_id:
-        query = query.filter(Product.category_id == int(category_id))
+        filters.append(Product.category_id == int(category_id))
     if brand_id:
-        query = query.filter(Product.brand_id == int(brand_id))
+        filters.append(Product.brand_id == int(brand_id))
+
+    default_sort = "relevance" if "relevance" in sort_columns else "name"
+    sort = request.args.get("sort", default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
 
-    products = query.all()
+    # Count on products alone (plus the search matches) - every other filter is on Product
+    total_query = db.session.query(func.count(Product.product_id))
+    if matches is not None:
+        total_query = total_query.join(matches, matches.c.product_id == Product.product_id)
+    total = total_query.filter(*filters).scalar()
+
+    sort_col = sort_columns[sort]
+    query = (
+        db.session.query(
+            Product.product_id,
+            Product.product_name,
+            Brand.brand_name,
+            AlcoholCategory.category_name,
+            BottleVolume.volume_ml,
+            func.coalesce(Stock.quantity, 0).label("quantity"),
+            Stock.last_updated,
+            effective_reorder_point().label("reorder_point"),
+            sort_col.label("sort_value")
+        )
+        .join(Brand, Brand.brand_id == Product.brand_id)
+        .join(AlcoholCategory, AlcoholCategory.category_id == Product.category_id)
+        .join(BottleVolume, BottleVolume.volume_id == Product.volume_id)
+        .outerjoin(Stock, (Stock.product_id == Product.product_id) & (Stock.org_id == org_id))
+    )
+    if matches is not None:
+        query = query.join(matches, matches.c.product_id == Product.product_id)
+    query = category_points(query, org_id).filter(*filters)
+
+    scan_descending = descending != backwards
+    if cursor:
+        try:
+            value, last_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            flash("Invalid page cursor. Showing the first page.")
+            cursor = ""
+            backwards = False
+            scan_descending = descending
+        else:
+            key = tuple_(sort_col, Product.product_id)
+            query = query.filter(key < tuple_(value, last_id) if scan_descending else key > tuple_(value, last_id))
+
+    if scan_descending:
+        query = query.order_by(sort_col.desc(), Product.product_id.desc())
+    else:
+        query = query.order_by(sort_col.asc(), Product.product_id.asc())
+
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+    has_next = True if backwards else more
+    has_previous = more if backwards else bool(cursor)
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor(rows[-1].sort_value, rows[-1].product_id)
+    if rows and has_previous:
+        prev_cursor = encode_cursor(rows[0].sort_value, rows[0].product_id)
 
     return render_template(
         "inventory.html",
-        stock_items=products,
+        stock_items=rows,
         brands=brands,
-        categories=categories
+        categories=categories,
+        total=total,
+        sort=sort,
+        descending=descending,
+        per_page=per_page,
+        next_cursor=next_cursor,
+        prev_cursor=prev_cursor,
+        is_first_page=not has_previous,
+        is_critical=is_critical
     )
 
 
@@ -64,72 +266,23 @@ def bulk_update_inventory():
                 flash("❌ Unauthorized product access.")
                 return redirect(url_for("inventory.inventory"))
 
-            stock = Stock.query.filter_by(product_id=product_id, org_id=org_id).first()
-            previous_quantity = stock.quantity if stock else 0
-
-            if stock:
-                stock.quantity = new_quantity
-                stock.last_updated = datetime.now()
-                stock.last_updated_by = user_id
+            # Same change-only path as Update All: no ledger row when the quantity is unchanged
+            changed, _ = save_stock_quantities(org_id, user_id, {product_id: new_quantity})
+            if changed:
+                flash(f"✅ Stock updated for product ID {product_id}.")
             else:
-                stock = Stock(
-                    product_id=product_id,
-                    org_id=org_id,
-                    quantity=new_quantity,
-                    last_updated=datetime.now(),
-                    last_updated_by=user_id
-                )
-                db.session.add(stock)
-
-            update_log = StockUpdate(
-                product_id=product_id,
-                previous_quantity=previous_quantity,
-                new_quantity=new_quantity,
-                updated_by=user_id
-            )
-            db.session.add(update_log)
-            db.session.commit()
-            flash(f"✅ Stock updated for product ID {product_id}.")
+                flash(f"Stock for product ID {product_id} is already {new_quantity}.")
 
         elif "update_all" in request.form:
             # Bulk update
+            quantities = {}
             for field_name, value in request.form.items():
                 if field_name.startswith("quantity["):
                     product_id = int(field_name.split("[")[1].split("]")[0])
-                    new_quantity = int(value)
-
-                    product = Product.query.filter_by(product_id=product_id, org_id=org_id).first()
-                    if not product:
-                        continue  # Skip products not belonging to current org
-
-                    stock = Stock.query.filter_by(product_id=product_id, org_id=org_id).first()
-                    previous_quantity = stock.quantity if stock else 0
-
-                    if stock:
-                        if stock.quantity != new_quantity:
-                            stock.quantity = new_quantity
-                            stock.last_updated = datetime.now()
-                            stock.last_updated_by = user_id
-                    else:
-                        stock = Stock(
-                            product_id=product_id,
-                            org_id=org_id,
-                            quantity=new_quantity,
-                            last_updated=datetime.now(),
-                            last_updated_by=user_id
-                        )
-                        db.session.add(stock)
-
-                    update_log = StockUpdate(
-                        product_id=product_id,
-                        previous_quantity=previous_quantity,
-                        new_quantity=new_quantity,
-                        updated_by=user_id
-                    )
-                    db.session.add(update_log)
-
-            db.session.commit()
-            flash("✅ Bulk stock update successful.")
+                    quantities[product_id] = int(value)
+
+            changed, elapsed_ms = save_stock_quantities(org_id, user_id, quantities)
+            flash(f"✅ Bulk stock update successful. {changed} item(s) changed in {elapsed_ms:.0f} ms.")
 
     except Exception as e:
         db.session.rollback()
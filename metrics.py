@@ -0,0 +1,197 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# In-process request instrumentation: latency, status and SQL statement
+# count/time per endpoint, kept as cumulative Prometheus histograms and
+# served as text from /metrics. SQL is timed with engine cursor events and
+# attributed to the current request (statements from background threads are
+# not counted). Requests over METRICS_SLOW_REQUEST_MS or issuing more than
+# METRICS_SLOW_REQUEST_STATEMENTS statements are printed with their slowest
+# SQL, and single statements over METRICS_SLOW_QUERY_MS are printed as they
+# finish. Counters are per worker process; scrape each worker or sum them.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum:.6f}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _statement(statement):
+    return " ".join(statement.split())[:500]
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = True
+        self.slow_request_ms = 500
+        self.slow_request_statements = 50
+        self.slow_query_ms = 100
+        self.allowed_hosts = ("127.0.0.1", "::1")
+        self.extra_collectors = []
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self._statements = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))
+        self._db_seconds = defaultdict(float)
+        self._responses = defaultdict(int)
+        self._slow_requests = defaultdict(int)
+        self._slow_queries = defaultdict(int)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", self.enabled)
+        self.slow_request_ms = app.config.get("METRICS_SLOW_REQUEST_MS", self.slow_request_ms)
+        self.slow_request_statements = app.config.get("METRICS_SLOW_REQUEST_STATEMENTS", self.slow_request_statements)
+        self.slow_query_ms = app.config.get("METRICS_SLOW_QUERY_MS", self.slow_query_ms)
+        self.allowed_hosts = tuple(app.config.get("METRICS_ALLOWED_HOSTS", self.allowed_hosts))
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        # Teardown runs after a streamed body has been sent, so CSV exports are timed in full
+        app.teardown_request(self._finish_request)
+        app.add_url_rule("/metrics", "metrics", self._metrics_view)
+
+    def add_collector(self, collector):
+        """Register a callable returning (name, help, type, value) samples at scrape time."""
+        self.extra_collectors.append(collector)
+        return collector
+
+    def _start_request(self):
+        g._metrics = {"start": time.perf_counter(), "statements": 0, "db_seconds": 0.0,
+                      "slowest": (0.0, None), "status": 500}
+
+    def _record_status(self, response):
+        state = g.get("_metrics")
+        if state is not None:
+            state["status"] = response.status_code
+        return response
+
+    def _finish_request(self, exc):
+        state = g.pop("_metrics", None)
+        if state is None:
+            return
+        elapsed = time.perf_counter() - state["start"]
+        endpoint = request.endpoint or "unmatched"
+        status = 500 if exc is not None else state["status"]
+        with self._lock:
+            self._latency[endpoint].observe(elapsed)
+            self._statements[endpoint].observe(state["statements"])
+            self._db_seconds[endpoint] += state["db_seconds"]
+            self._responses[endpoint, request.method, status] += 1
+            slow = (elapsed * 1000 >= self.slow_request_ms
+                    or state["statements"] > self.slow_request_statements)
+            if slow:
+                self._slow_requests[endpoint] += 1
+        if slow:
+            slowest_seconds, slowest_sql = state["slowest"]
+            print(f"[Slow Request] {request.method} {request.path} ({endpoint}) {elapsed * 1000:.1f}ms, "
+                  f"{state['statements']} statements, {state['db_seconds'] * 1000:.1f}ms in SQL; "
+                  f"slowest {slowest_seconds * 1000:.1f}ms: {slowest_sql}")
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["_metrics_start"] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = conn.info.pop("_metrics_start", None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        if not has_request_context():
+            return
+        state = g.get("_metrics")
+        if state is None:
+            return
+        state["statements"] += 1
+        state["db_seconds"] += elapsed
+        if elapsed > state["slowest"][0]:
+            state["slowest"] = (elapsed, _statement(statement))
+        if elapsed * 1000 >= self.slow_query_ms:
+            endpoint = request.endpoint or "unmatched"
+            with self._lock:
+                self._slow_queries[endpoint] += 1
+            print(f"[Slow Query] {elapsed * 1000:.1f}ms in {endpoint}: {_statement(statement)}")
+
+    def _metrics_view(self):
+        if request.remote_addr not in self.allowed_hosts:
+            abort(404)
+        return Response(self.render(), mimetype="text/plain; version=0.0.4")
+
+    def render(self):
+        lines = []
+        with self._lock:
+            lines += ["# HELP http_request_duration_seconds Request latency by endpoint.",
+                      "# TYPE http_request_duration_seconds histogram"]
+            for endpoint, histogram in sorted(self._latency.items()):
+                lines += histogram.lines("http_request_duration_seconds", f'endpoint="{_escape(endpoint)}"')
+
+            lines += ["# HELP http_requests_total Responses by endpoint, method and status.",
+                      "# TYPE http_requests_total counter"]
+            for (endpoint, method, status), count in sorted(self._responses.items()):
+                lines.append(f'http_requests_total{{endpoint="{_escape(endpoint)}",method="{method}",'
+                             f'status="{status}"}} {count}')
+
+            lines += ["# HELP db_statements_per_request SQL statements issued per request.",
+                      "# TYPE db_statements_per_request histogram"]
+            for endpoint, histogram in sorted(self._statements.items()):
+                lines += histogram.lines("db_statements_per_request", f'endpoint="{_escape(endpoint)}"')
+
+            lines += ["# HELP db_time_seconds_total Time spent executing SQL by endpoint.",
+                      "# TYPE db_time_seconds_total counter"]
+            for endpoint, seconds in sorted(self._db_seconds.items()):
+                lines.append(f'db_time_seconds_total{{endpoint="{_escape(endpoint)}"}} {seconds:.6f}')
+
+            for name, help_text, counts in (
+                ("slow_requests_total", "Requests over the slow latency or statement threshold.", self._slow_requests),
+                ("slow_queries_total", "SQL statements over the slow query threshold.", self._slow_queries),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for endpoint, count in sorted(counts.items()):
+                    lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {count}')
+
+        for collector in self.extra_collectors:
+            for name, help_text, kind, value in collector():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(*args):
+    if metrics.enabled:
+        metrics.before_cursor_execute(*args)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(*args):
+    if metrics.enabled:
+        metrics.after_cursor_execute(*args)
@@ -1,9 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.mysql import DECIMAL
 import pyotp
+from sharding import TenantSession
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": TenantSession})
 
 
 class Organization(db.Model):
@@ -65,9 +66,11 @@ class Product(db.Model):
     category_id = db.Column(db.Integer, db.ForeignKey("alcohol_categories.category_id", ondelete="CASCADE"), nullable=False)
     volume_id = db.Column(db.Integer, db.ForeignKey("bottle_volumes.volume_id", ondelete="CASCADE"), nullable=False)
     org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False)
+    reorder_point = db.Column(db.Integer, nullable=True)  # None falls back to the category's, see reorder.py
 
     __table_args__ = (
         db.UniqueConstraint("product_name", "brand_id", "category_id", "volume_id", "org_id", name="uq_product_combination"),
+        db.Index("ix_products_org_name", "org_id", "product_name"),
     )
 
     organization = db.relationship("Organization", backref=db.backref("products", passive_deletes=True))
@@ -85,11 +88,39 @@ class Stock(db.Model):
     last_updated = db.Column(db.DateTime, default=db.func.current_timestamp())
     last_updated_by = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="SET NULL"))
 
+    __table_args__ = (
+        db.Index("ix_stock_org_updated", "org_id", "last_updated"),
+        db.Index("uq_stock_org_product", "org_id", "product_id", unique=True),  # One stock row per product
+    )
+
     product = db.relationship("Product", backref=db.backref("stock", passive_deletes=True))
     organization = db.relationship("Organization", backref=db.backref("stock_entries", passive_deletes=True))
     user = db.relationship("User", backref=db.backref("stock_updates", passive_deletes=True))
 
 
+# An org's reorder point for every product in a category without its own
+class CategoryReorderPoint(db.Model):
+    __tablename__ = "category_reorder_points"
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey("alcohol_categories.category_id", ondelete="CASCADE"), primary_key=True)
+    reorder_point = db.Column(db.Integer, nullable=False)
+
+
+# Products whose stock is below their reorder point, maintained by
+# reorder.refresh_low_stock alongside every stock write
+class LowStock(db.Model):
+    __tablename__ = "low_stock"
+    product_id = db.Column(db.Integer, db.ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    reorder_point = db.Column(db.Integer, nullable=False)
+    flagged_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_low_stock_org_quantity", "org_id", "quantity"),
+    )
+
+
 class StockUpdate(db.Model):
     __tablename__ = "stock_updates"
     update_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -99,10 +130,47 @@ class StockUpdate(db.Model):
     update_time = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_by = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="SET NULL"))
 
+    __table_args__ = (
+        db.Index("ix_stock_updates_product_time", "product_id", "update_time"),
+        db.Index("ix_stock_updates_time", "update_time"),  # Retention cutoffs
+        {"sqlite_autoincrement": True},  # Never reuse the ids of compacted rows (see retention.py)
+    )
+
     product = db.relationship("Product", backref=db.backref("stock_updates", passive_deletes=True))
     user = db.relationship("User", backref=db.backref("stock_change_logs", passive_deletes=True))
 
 
+# Per-product, per-day summary of stock_updates rows past the retention
+# window; the rows themselves live in archive files (see retention.py)
+class StockUpdateDay(db.Model):
+    __tablename__ = "stock_update_days"
+    product_id = db.Column(db.Integer, db.ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    updates = db.Column(db.Integer, nullable=False)
+    opening_quantity = db.Column(db.Integer, nullable=False)
+    closing_quantity = db.Column(db.Integer, nullable=False)
+    net_change = db.Column(db.Integer, nullable=False)
+
+
+class StockSnapshot(db.Model):
+    __tablename__ = "stock_snapshots"
+    snapshot_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.product_id", ondelete="CASCADE"), nullable=False)
+    snapshot_date = db.Column(db.Date, nullable=False)
+    opening_quantity = db.Column(db.Integer, nullable=False)
+    closing_quantity = db.Column(db.Integer, nullable=False)
+    sold_quantity = db.Column(db.Integer, nullable=False, default=0)
+    adjusted_quantity = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("org_id", "product_id", "snapshot_date", name="uq_stock_snapshot_day"),
+        db.Index("ix_stock_snapshots_org_date", "org_id", "snapshot_date"),
+    )
+
+    product = db.relationship("Product", backref=db.backref("stock_snapshots", passive_deletes=True))
+
+
 class Sale(db.Model):
     __tablename__ = "sales"
     sale_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -112,12 +180,35 @@ class Sale(db.Model):
     total_price = db.Column(DECIMAL(10, 2), nullable=False)
     sale_date = db.Column(db.Date, default=db.func.current_date(), index=True)
     sold_by = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="SET NULL"))
+    updated_at = db.Column(db.DateTime, nullable=True)  # Set on every write, drives /api/v1/changes
+
+    __table_args__ = (
+        db.Index("ix_sales_org_updated", "org_id", "updated_at"),
+        # Covers the forecasting window scan without touching the table
+        db.Index("ix_sales_org_date_product", "org_id", "sale_date", "product_id", "quantity_sold"),
+    )
 
     product = db.relationship("Product", backref=db.backref("sales", passive_deletes=True))
     organization = db.relationship("Organization", backref=db.backref("sales_records", passive_deletes=True))
     user = db.relationship("User", backref=db.backref("sales_made", passive_deletes=True))
 
 
+class SalesRollup(db.Model):
+    __tablename__ = "sales_rollups"
+    rollup_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False)
+    period = db.Column(db.String(5), nullable=False)  # day, week, month
+    period_start = db.Column(db.Date, nullable=False)
+    dimension = db.Column(db.String(10), nullable=False)  # total, category, brand
+    dimension_id = db.Column(db.Integer, nullable=False, default=0)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(DECIMAL(12, 2), nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint("org_id", "period", "period_start", "dimension", "dimension_id", name="uq_sales_rollup"),
+    )
+
+
 class Price(db.Model):
     __tablename__ = "prices"
     price_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -126,13 +217,79 @@ class Price(db.Model):
     effective_date = db.Column(db.DateTime, default=db.func.current_timestamp())
     updated_by = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="SET NULL"))
 
+    __table_args__ = (
+        db.Index("ix_prices_product_effective", "product_id", "effective_date"),
+    )
+
     product = db.relationship("Product", backref=db.backref("price_history", passive_deletes=True))
     user = db.relationship("User", backref=db.backref("price_updates", passive_deletes=True))
 
 
+# Latest Price row per product, maintained by pricing.set_price
+class CurrentPrice(db.Model):
+    __tablename__ = "current_prices"
+    product_id = db.Column(db.Integer, db.ForeignKey("products.product_id", ondelete="CASCADE"), primary_key=True)
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False, index=True)
+    price = db.Column(DECIMAL(10, 2), nullable=False)
+    effective_date = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_current_prices_org_effective", "org_id", "effective_date"),
+    )
+
+    product = db.relationship("Product", backref=db.backref("current_price", uselist=False, passive_deletes=True))
+
+
+# Per-org change counter bumped in the same transaction as stock, product,
+# price and sale writes; drives page ETags and the rendered-page cache
+class OrgVersion(db.Model):
+    __tablename__ = "org_versions"
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False)
+
+
+# One committed POS ingestion batch, keyed by the client's idempotency key;
+# result holds the per-line outcome JSON that a retry gets back
+class IngestBatch(db.Model):
+    __tablename__ = "ingest_batches"
+    batch_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    org_id = db.Column(db.Integer, db.ForeignKey("organizations.org_id", ondelete="CASCADE"), nullable=False)
+    idempotency_key = db.Column(db.String(200), nullable=False)
+    line_count = db.Column(db.Integer, nullable=False)
+    accepted_count = db.Column(db.Integer, nullable=False)
+    result = db.Column(db.Text, nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey("users.user_id", ondelete="SET NULL"))
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.UniqueConstraint("org_id", "idempotency_key", name="uq_ingest_batch_key"),
+    )
+
+
 class UserActionLog(db.Model):
     __tablename__ = "user_action_logs"
     log_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     user_id = db.Column(db.Integer, nullable=True)
     action = db.Column(db.String(255), nullable=False)
     timestamp = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index("ix_user_action_logs_user_time", "user_id", "timestamp"),
+        db.Index("ix_user_action_logs_time", "timestamp"),  # Retention cutoffs
+        {"sqlite_autoincrement": True},  # Never reuse the ids of compacted rows (see retention.py)
+    )
+
+
+# Daily action counts per user for user_action_logs rows past the retention window
+class UserActionDay(db.Model):
+    __tablename__ = "user_action_days"
+    summary_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    day = db.Column(db.Date, nullable=False)
+    user_id = db.Column(db.Integer, nullable=True)
+    action = db.Column(db.String(255), nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        db.Index("uq_user_action_day", "day", "user_id", "action", unique=True),
+    )
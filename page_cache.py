@@ -0,0 +1,98 @@
+import hashlib
+import time
+from datetime import date, datetime
+from functools import wraps
+from flask import Response, current_app, get_flashed_messages, request, session
+from flask_login import current_user
+from sqlalchemy import inspect, select, update
+from catalog_cache import LRUCache
+from models import db, Organization, OrgVersion
+
+# Conditional GET for pages that bartenders keep refreshing. Every write to
+# an org's stock, products, prices or sales bumps org_versions.version in
+# the same transaction, so the version read at the start of a request says
+# whether anything the page shows could have changed. The page's ETag is
+# derived from it together with the user, the full URL and today's date
+# (for pages that default to today). A matching If-None-Match gets a 304
+# without rendering. Otherwise a cached render for the same key is served,
+# and only on a miss does the view run. The version lives in the database,
+# so writes in one worker invalidate pages served by every other worker.
+# Requests with pending flash messages bypass all of this, as does every
+# request when PAGE_CACHE_ENABLED is off.
+
+_pages = LRUCache(maxsize=512)
+# Restarting (e.g. deploying new templates) must not revalidate pages rendered before it
+_BOOT = str(time.time())
+
+
+def bump_org_version(org_id):
+    """Mark the org's pages stale; the caller commits."""
+    now = datetime.now()
+    bumped = db.session.execute(
+        update(OrgVersion).where(OrgVersion.org_id == org_id)
+        .values(version=OrgVersion.version + 1, changed_at=now)
+    )
+    if bumped.rowcount == 0:
+        db.session.add(OrgVersion(org_id=org_id, version=1, changed_at=now))
+
+
+def org_version(org_id):
+    row = db.session.execute(
+        select(OrgVersion.version, OrgVersion.changed_at).where(OrgVersion.org_id == org_id)
+    ).first()
+    return (row.version, row.changed_at) if row else (0, None)
+
+
+def ensure_org_versions():
+    """Create org_versions on databases that predate it, with a row per org."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Organization.__tablename__) or inspector.has_table(OrgVersion.__tablename__):
+        return
+    OrgVersion.__table__.create(db.engine, checkfirst=True)
+    now = datetime.now()
+    db.session.bulk_insert_mappings(OrgVersion, [
+        {"org_id": org_id, "version": 0, "changed_at": now}
+        for (org_id,) in db.session.query(Organization.org_id)
+    ])
+    db.session.commit()
+
+
+def _with_validators(response, etag, changed_at):
+    response.set_etag(etag, weak=True)
+    if changed_at is not None:
+        response.last_modified = changed_at
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def conditional_page(view):
+    """Serve GETs of an org-scoped page from ETags and the render cache; see module comment."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if (request.method != "GET" or not current_user.is_authenticated or "_flashes" in session
+                or not current_app.config.get("PAGE_CACHE_ENABLED", True)):
+            return view(*args, **kwargs)
+
+        version, changed_at = org_version(current_user.org_id)
+        key = (request.endpoint, current_user.org_id, current_user.user_id, version,
+               date.today().isoformat(), request.full_path)
+        etag = hashlib.sha1(repr((_BOOT,) + key).encode()).hexdigest()
+
+        if request.if_none_match.contains_weak(etag):
+            return _with_validators(Response(status=304), etag, changed_at)
+
+        body = _pages.get(key)
+        if body is None:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype != "text/html" or get_flashed_messages():
+                return response
+            _pages.maxsize = current_app.config.get("PAGE_CACHE_SIZE", _pages.maxsize)
+            _pages.put(key, response.get_data(), current_app.config.get("PAGE_CACHE_TTL", 300))
+        else:
+            response = Response(body, mimetype="text/html")
+        return _with_validators(response, etag, changed_at)
+    return wrapped
+
+
+def page_cache_stats():
+    return {"hits": _pages.hits, "misses": _pages.misses, "entries": len(_pages), "maxsize": _pages.maxsize}
@@ -0,0 +1,107 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import flash, redirect, request
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Password hashing and verification off the request thread. Hashes run on a
+# small thread pool (hashlib releases the GIL while hashing), and a semaphore
+# caps how many can be running or waiting at once, so a burst of logins
+# queues for at most PASSWORD_HASH_WAIT_SECONDS and then fails fast with
+# PasswordHashBusy instead of tying up every worker thread. The hash method
+# comes from PASSWORD_HASH_METHOD and the salt length from
+# PASSWORD_SALT_LENGTH; stored hashes made with another method, other
+# iterations/cost or another salt length are upgraded on the next successful
+# login (see needs_rehash).
+
+
+class PasswordHashBusy(Exception):
+    pass
+
+
+def _normalized(method):
+    """Spell out werkzeug's default parameters so stored and configured methods compare equal."""
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        if len(parts) == 1:
+            parts.append("sha256")
+        if len(parts) == 2:
+            parts.append(str(DEFAULT_PBKDF2_ITERATIONS))
+    elif parts[0] == "scrypt" and len(parts) == 1:
+        parts += ["32768", "8", "1"]
+    return ":".join(parts)
+
+
+class PasswordHasher:
+    def __init__(self, method="pbkdf2:sha256", salt_length=16, workers=2, max_pending=16, wait_seconds=10.0):
+        self.method = method
+        self.salt_length = salt_length
+        self.workers = workers
+        self.max_pending = max_pending
+        self.wait_seconds = wait_seconds
+        self._executor = None
+        self._slots = None
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", self.method)
+        self.salt_length = app.config.get("PASSWORD_SALT_LENGTH", self.salt_length)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS", self.workers)
+        self.max_pending = max(self.workers, app.config.get("PASSWORD_HASH_MAX_PENDING", self.max_pending))
+        self.wait_seconds = app.config.get("PASSWORD_HASH_WAIT_SECONDS", self.wait_seconds)
+        app.register_error_handler(PasswordHashBusy, self._busy)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method, salt_length=self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when the stored hash's method, its parameters or its salt length differ from the configured ones."""
+        method, _, rest = password_hash.partition("$")
+        salt = rest.partition("$")[0]
+        return _normalized(method) != _normalized(self.method) or len(salt) != self.salt_length
+
+    def _run(self, fn, *args, **kwargs):
+        self._ensure_pool()
+        if not self._slots.acquire(timeout=self.wait_seconds):
+            raise PasswordHashBusy()
+        try:
+            return self._executor.submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+
+    def _ensure_pool(self):
+        if self._executor is not None:
+            return
+        with self._start_lock:
+            if self._executor is None:
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+
+    def _after_fork(self):
+        # Pool threads do not survive a fork; the child builds its own on first use
+        self._executor = None
+        self._slots = None
+        self._start_lock = threading.Lock()
+
+    def _busy(self, error):
+        flash('Too many sign-ins at once. Please try again in a moment.')
+        return redirect(request.url)
+
+
+password_hasher = PasswordHasher()
+os.register_at_fork(after_in_child=password_hasher._after_fork)
+
+
+def hash_password(password):
+    return password_hasher.hash(password)
+
+
+def verify_password(password_hash, password):
+    return password_hasher.verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return password_hasher.needs_rehash(password_hash)
@@ -0,0 +1,123 @@
+from datetime import datetime, date, timedelta
+from sqlalchemy import func, inspect
+from models import db, Product, Price, CurrentPrice
+
+# Price history lives in `prices` (append-only); `current_prices` holds the
+# latest row per product so a whole org's current prices are one indexed read.
+
+
+def set_price(product_id, org_id, price, user_id):
+    """Append a price to the history and make it the product's current price; the caller commits."""
+    now = datetime.now()
+    db.session.add(Price(product_id=product_id, price=price, effective_date=now, updated_by=user_id))
+
+    current = db.session.get(CurrentPrice, product_id)
+    if current is None:
+        db.session.add(CurrentPrice(product_id=product_id, org_id=org_id, price=price, effective_date=now))
+    else:
+        current.price = price
+        current.effective_date = now
+
+
+def set_initial_prices(product_ids, org_id, price, user_id):
+    """Bulk version of set_price for freshly inserted products."""
+    now = datetime.now()
+    db.session.bulk_insert_mappings(Price, [
+        {"product_id": product_id, "price": price, "effective_date": now, "updated_by": user_id}
+        for product_id in product_ids
+    ])
+    db.session.bulk_insert_mappings(CurrentPrice, [
+        {"product_id": product_id, "org_id": org_id, "price": price, "effective_date": now}
+        for product_id in product_ids
+    ])
+
+
+def current_price(product_id):
+    current = db.session.get(CurrentPrice, product_id)
+    return float(current.price) if current else None
+
+
+def current_prices(org_id):
+    """Current price per product for the whole org, in one query."""
+    rows = db.session.query(CurrentPrice.product_id, CurrentPrice.price).filter(CurrentPrice.org_id == org_id)
+    return {product_id: float(price) for product_id, price in rows}
+
+
+def prices_at(product_ids, when):
+    """Prices in effect at ``when`` for many products, in one grouped query.
+
+    A ``date`` means the end of that day, so a back-dated sale picks up any
+    price change made earlier that same day. Products with no price yet at
+    ``when`` are left out.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    if not isinstance(when, datetime):
+        when = datetime.combine(when + timedelta(days=1), datetime.min.time())
+        inclusive = False
+    else:
+        inclusive = True
+
+    cutoff = Price.effective_date <= when if inclusive else Price.effective_date < when
+    latest = (
+        db.session.query(Price.product_id, func.max(Price.effective_date).label("effective_date"))
+        .filter(Price.product_id.in_(product_ids), cutoff)
+        .group_by(Price.product_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(Price.product_id, Price.price)
+        .join(latest, (Price.product_id == latest.c.product_id) & (Price.effective_date == latest.c.effective_date))
+        .order_by(Price.price_id)
+    )
+    # Ordered by price_id so the last row written wins an effective_date tie
+    return {product_id: float(price) for product_id, price in rows}
+
+
+def prices_for_date(org_id, product_ids, sale_date):
+    """Prices to charge for sales on ``sale_date``: current for today, historical otherwise."""
+    if sale_date >= date.today():
+        prices = current_prices(org_id)
+        return {product_id: prices[product_id] for product_id in product_ids if product_id in prices}
+    prices = prices_at(product_ids, sale_date)
+    # Products priced only after sale_date fall back to their current price
+    missing = [product_id for product_id in product_ids if product_id not in prices]
+    if missing:
+        current = current_prices(org_id)
+        prices.update((product_id, current[product_id]) for product_id in missing if product_id in current)
+    return prices
+
+
+def rebuild_current_prices(org_id=None):
+    """Recompute current_prices from the price history (latest row written wins); the caller commits."""
+    latest = (
+        db.session.query(Price.product_id, func.max(Price.price_id).label("price_id"))
+        .group_by(Price.product_id)
+    )
+    delete = CurrentPrice.query
+    if org_id is not None:
+        latest = latest.join(Product, Product.product_id == Price.product_id).filter(Product.org_id == org_id)
+        delete = delete.filter(CurrentPrice.org_id == org_id)
+    latest = latest.subquery()
+
+    delete.delete(synchronize_session=False)
+    rows = (
+        db.session.query(Price.product_id, Product.org_id, Price.price, Price.effective_date)
+        .join(latest, Price.price_id == latest.c.price_id)
+        .join(Product, Product.product_id == Price.product_id)
+    )
+    db.session.bulk_insert_mappings(CurrentPrice, [
+        {"product_id": product_id, "org_id": row_org_id, "price": price, "effective_date": effective_date or datetime.now()}
+        for product_id, row_org_id, price, effective_date in rows
+    ])
+
+
+def ensure_current_prices():
+    """Create and backfill current_prices on databases that predate it."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Product.__tablename__) or inspector.has_table(CurrentPrice.__tablename__):
+        return
+    CurrentPrice.__table__.create(db.engine, checkfirst=True)
+    rebuild_current_prices()
+    db.session.commit()
@@ -0,0 +1,166 @@
+import argparse
+import sys
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, func, inspect, insert, literal, select, text
+from models import (db, Organization, Product, Stock, Brand, AlcoholCategory, BottleVolume,
+                    CategoryReorderPoint, LowStock)
+from sharding import tenant_scope
+
+# Reorder points and the low-stock set. A product's reorder point is its own
+# Product.reorder_point, else its category's for the org
+# (category_reorder_points), else DEFAULT_REORDER_POINT. low_stock holds one
+# row per product whose stock is below its reorder point. Every write path
+# that changes Stock.quantity or a reorder point calls refresh_low_stock for
+# the products it touched, in the same transaction, so "what needs
+# reordering" is one indexed read of low_stock by org.
+#
+# low_stock stores the effective reorder point. After changing
+# DEFAULT_REORDER_POINT, rebuild it with `python reorder.py --rebuild`.
+
+DEFAULT_REORDER_POINT = 25
+DEFAULT_CRITICAL_FRACTION = 0.4
+
+
+def default_reorder_point():
+    return current_app.config.get("DEFAULT_REORDER_POINT", DEFAULT_REORDER_POINT)
+
+
+def effective_reorder_point():
+    """Column expression for the reorder point of each Product row; join category_points() first."""
+    return func.coalesce(Product.reorder_point, CategoryReorderPoint.reorder_point, default_reorder_point())
+
+
+def category_points(query, org_id):
+    """Outer-join an org's category reorder points onto a query over Product."""
+    return query.outerjoin(CategoryReorderPoint, (CategoryReorderPoint.org_id == org_id)
+                           & (CategoryReorderPoint.category_id == Product.category_id))
+
+
+def is_critical(quantity, reorder_point):
+    fraction = current_app.config.get("REORDER_CRITICAL_FRACTION", DEFAULT_CRITICAL_FRACTION)
+    return quantity < reorder_point * fraction
+
+
+def refresh_low_stock(org_id, product_ids=None):
+    """Recompute low_stock rows for ``product_ids`` (default: the whole org); the caller commits.
+
+    Two set-based statements whatever the number of products: delete the
+    products' rows, then insert the ones now below their reorder point.
+    """
+    if product_ids is not None:
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+    for statement in low_stock_statements(org_id, product_ids):
+        db.session.execute(statement)
+
+
+def low_stock_statements(org_id, product_ids=None):
+    """The (delete, insert) pair behind refresh_low_stock, for callers holding a plain connection."""
+    levels = (
+        select(Stock.product_id, func.sum(Stock.quantity).label("quantity"))
+        .where(Stock.org_id == org_id)
+        .group_by(Stock.product_id)
+    )
+    if product_ids is not None:
+        levels = levels.where(Stock.product_id.in_(product_ids))
+    levels = levels.subquery()
+
+    quantity = func.coalesce(levels.c.quantity, 0)
+    reorder_point = effective_reorder_point()
+    below = category_points(
+        select(Product.product_id, literal(org_id), quantity, reorder_point, literal(datetime.now()))
+        .select_from(Product)
+        .outerjoin(levels, levels.c.product_id == Product.product_id),
+        org_id
+    ).where(Product.org_id == org_id, quantity < reorder_point)
+
+    stale = delete(LowStock).where(LowStock.org_id == org_id)
+    if product_ids is not None:
+        stale = stale.where(LowStock.product_id.in_(product_ids))
+        below = below.where(Product.product_id.in_(product_ids))
+    return stale, insert(LowStock).from_select(
+        ["product_id", "org_id", "quantity", "reorder_point", "flagged_at"], below
+    )
+
+
+def reorder_list(org_id):
+    """Products below their reorder point, emptiest first, in one read over ix_low_stock_org_quantity."""
+    rows = (
+        db.session.query(
+            LowStock.product_id, Product.product_name, Brand.brand_name, AlcoholCategory.category_name,
+            BottleVolume.volume_ml, LowStock.quantity, LowStock.reorder_point, LowStock.flagged_at
+        )
+        .join(Product, Product.product_id == LowStock.product_id)
+        .join(Brand, Brand.brand_id == Product.brand_id)
+        .join(AlcoholCategory, AlcoholCategory.category_id == Product.category_id)
+        .join(BottleVolume, BottleVolume.volume_id == Product.volume_id)
+        .filter(LowStock.org_id == org_id)
+        .order_by(LowStock.quantity, LowStock.product_id)
+    )
+    return [dict(row._asdict(), shortfall=row.reorder_point - row.quantity) for row in rows]
+
+
+def set_category_reorder_point(org_id, category_id, reorder_point):
+    """Set (or with None, clear) an org's reorder point for a category; the caller commits."""
+    db.session.execute(delete(CategoryReorderPoint).where(
+        CategoryReorderPoint.org_id == org_id, CategoryReorderPoint.category_id == category_id
+    ))
+    if reorder_point is not None:
+        db.session.add(CategoryReorderPoint(org_id=org_id, category_id=category_id, reorder_point=reorder_point))
+        db.session.flush()
+    product_ids = [
+        product_id for (product_id,) in db.session.query(Product.product_id)
+        .filter(Product.org_id == org_id, Product.category_id == category_id)
+    ]
+    refresh_low_stock(org_id, product_ids)
+
+
+def category_reorder_points(org_id):
+    return dict(
+        db.session.query(CategoryReorderPoint.category_id, CategoryReorderPoint.reorder_point)
+        .filter(CategoryReorderPoint.org_id == org_id)
+    )
+
+
+def rebuild_low_stock():
+    """Recompute low_stock for every org; returns the number of products flagged."""
+    flagged = 0
+    for org_id in db.session.execute(select(Organization.org_id)).scalars().all():
+        with tenant_scope(org_id):
+            refresh_low_stock(org_id)
+            db.session.commit()
+            flagged += db.session.query(func.count(LowStock.product_id)).filter(LowStock.org_id == org_id).scalar()
+    return flagged
+
+
+def ensure_low_stock():
+    """Add reorder points and build low_stock on databases that predate them."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Product.__tablename__):
+        return
+    if "reorder_point" not in {column["name"] for column in inspector.get_columns(Product.__tablename__)}:
+        with db.engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {Product.__tablename__} ADD COLUMN reorder_point INTEGER"))
+    CategoryReorderPoint.__table__.create(db.engine, checkfirst=True)
+    if not inspector.has_table(LowStock.__tablename__):
+        LowStock.__table__.create(db.engine, checkfirst=True)
+        rebuild_low_stock()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the low-stock set for every organization.")
+    parser.add_argument("--rebuild", action="store_true", required=True)
+    parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        count = rebuild_low_stock()
+    print(f"✅ Rebuilt low stock: {count} product(s) below their reorder point.")
+    return 0
+
+
+# Usage: python reorder.py --rebuild
+if __name__ == "__main__":
+    sys.exit(main())
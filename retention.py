@@ -0,0 +1,280 @@
+import argparse
+import gzip
+import json
+import os
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import inspect
+from models import db, Product, StockUpdate, StockUpdateDay, UserActionLog, UserActionDay
+from sharding import DIRECTORY_TABLES, current_shard, known_shards, shard_scope
+
+# Retention for the append-only ledgers. Rows older than the live window
+# (RETENTION_STOCK_UPDATE_DAYS / RETENTION_ACTION_LOG_DAYS) are handled in
+# chunks of whole days. Each chunk goes through three steps:
+#
+#   1. Its rows are written to a gzipped NDJSON file under ARCHIVE_DIR/<table>/.
+#      The file is written to a temporary name and renamed once complete.
+#   2. The rows are folded into the per-day summary table: stock_update_days
+#      for stock_updates, user_action_days for user_action_logs.
+#   3. The rows are deleted, in the same transaction as step 2.
+#
+# A crash between steps 1 and 3 leaves the rows live, so a later run
+# archives them again. Days are the UTC dates of the stored timestamps, the
+# same days backfill_snapshots groups by.
+#
+# restore() puts a day range back into the live table from the archives and
+# drops the summaries of the rows it put back. A row counts as already live
+# when a live row in the range has the same values, not just the same id:
+# tables created before the ledgers used AUTOINCREMENT hand the ids of
+# compacted rows out again. An archived row whose id is taken by another
+# row gets a new id. The rows are compacted again by the next run unless
+# the window has been widened to include them.
+#
+# With tenant sharding, stock_updates is compacted shard by shard and its
+# archives go under ARCHIVE_DIR/<shard>/, so a restore only reads back the
+# shard's own rows.
+
+ARCHIVE_CHUNK_DAYS = 31
+
+
+def _stock_update_key(row):
+    return row["product_id"], row["update_time"].date()
+
+
+def _stock_update_summaries(rows, existing):
+    days = {}
+    for row in rows:  # In update_id order
+        key = _stock_update_key(row)
+        summary = days.get(key)
+        if summary is None:
+            summary = days[key] = {"product_id": key[0], "day": key[1], "updates": 0,
+                                   "opening_quantity": row["previous_quantity"], "net_change": 0}
+        summary["updates"] += 1
+        summary["net_change"] += row["new_quantity"] - row["previous_quantity"]
+        summary["closing_quantity"] = row["new_quantity"]
+
+    inserts, updates = [], []
+    for key, summary in days.items():
+        current = existing.get(key)
+        if current is None:
+            inserts.append(summary)
+        else:
+            updates.append(dict(summary, updates=current.updates + summary["updates"],
+                                opening_quantity=current.opening_quantity,
+                                net_change=current.net_change + summary["net_change"]))
+    return inserts, updates
+
+
+def _existing_stock_update_days(day_from, day_to):
+    return {
+        (row.product_id, row.day): row for row in
+        StockUpdateDay.query.filter(StockUpdateDay.day >= day_from, StockUpdateDay.day < day_to)
+    }
+
+
+def _action_key(row):
+    return row["timestamp"].date(), row["user_id"], row["action"]
+
+
+def _action_summaries(rows, existing):
+    counts = {}
+    for row in rows:
+        key = _action_key(row)
+        counts[key] = counts.get(key, 0) + 1
+
+    inserts, updates = [], []
+    for (day, user_id, action), count in counts.items():
+        current = existing.get((day, user_id, action))
+        if current is None:
+            inserts.append({"day": day, "user_id": user_id, "action": action, "count": count})
+        else:
+            updates.append({"summary_id": current.summary_id, "count": current.count + count})
+    return inserts, updates
+
+
+def _existing_action_days(day_from, day_to):
+    return {
+        (row.day, row.user_id, row.action): row for row in
+        UserActionDay.query.filter(UserActionDay.day >= day_from, UserActionDay.day < day_to)
+    }
+
+
+# table -> (model, id column, time column, summary model, summary key of a row,
+#           existing summaries loader, summarizer, window config key, default days)
+LEDGERS = {
+    "stock_updates": (StockUpdate, StockUpdate.update_id, StockUpdate.update_time,
+                      StockUpdateDay, _stock_update_key, _existing_stock_update_days,
+                      _stock_update_summaries, "RETENTION_STOCK_UPDATE_DAYS", 180),
+    "user_action_logs": (UserActionLog, UserActionLog.log_id, UserActionLog.timestamp,
+                         UserActionDay, _action_key, _existing_action_days,
+                         _action_summaries, "RETENTION_ACTION_LOG_DAYS", 90),
+}
+
+
+def ensure_retention_tables():
+    """Create the summary tables on databases that predate them."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Product.__tablename__):
+        return
+    for model in (StockUpdateDay, UserActionDay):
+        model.__table__.create(db.engine, checkfirst=True)
+
+
+def _archive_dir(table):
+    shard = None if table in DIRECTORY_TABLES else current_shard()
+    path = os.path.join(current_app.config.get("ARCHIVE_DIR", "archive"), *([shard] if shard else []), table)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _columns(model):
+    return [column.name for column in model.__table__.columns]
+
+
+def _write_archive(table, day_from, day_to, rows):
+    """Write rows to <table>_<first day>_<last day>_<stamp>.jsonl.gz; returns the path."""
+    stamp = datetime.now().strftime("%Y%m%d%H%M%S%f")
+    name = f"{table}_{day_from.isoformat()}_{(day_to - timedelta(days=1)).isoformat()}_{stamp}.jsonl.gz"
+    path = os.path.join(_archive_dir(table), name)
+    partial = path + ".partial"
+    with gzip.open(partial, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({key: _encode(value) for key, value in row.items()}, separators=(",", ":")))
+            f.write("\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(partial, path)
+    return path
+
+
+def compact(table, today=None, dry_run=False):
+    """Archive and summarize ``table`` rows older than its live window; returns per-chunk results."""
+    model, id_col, time_col, summary_model, _, load_existing, summarize, config_key, default_days = LEDGERS[table]
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = today - timedelta(days=current_app.config.get(config_key, default_days))
+    oldest = db.session.query(db.func.min(time_col)).scalar()
+    if oldest is None:
+        return []
+    if isinstance(oldest, str):
+        oldest = datetime.fromisoformat(oldest)
+
+    results = []
+    day_from = oldest.date()
+    while day_from < cutoff:
+        day_to = min(day_from + timedelta(days=ARCHIVE_CHUNK_DAYS), cutoff)
+        in_chunk = (time_col >= datetime.combine(day_from, datetime.min.time()),
+                    time_col < datetime.combine(day_to, datetime.min.time()))
+        rows = [
+            row._asdict() for row in
+            db.session.query(*model.__table__.columns).filter(*in_chunk).order_by(id_col)
+        ]
+        if rows:
+            result = {"table": table, "from": day_from, "to": day_to - timedelta(days=1), "rows": len(rows)}
+            if not dry_run:
+                result["file"] = _write_archive(table, day_from, day_to, rows)
+                inserts, updates = summarize(rows, load_existing(day_from, day_to))
+                if inserts:
+                    db.session.bulk_insert_mappings(summary_model, inserts)
+                if updates:
+                    db.session.bulk_update_mappings(summary_model, updates)
+                model.query.filter(*in_chunk).delete(synchronize_session=False)
+                db.session.commit()
+            results.append(result)
+        day_from = day_to
+    return results
+
+
+def _archives(table, day_from, day_to):
+    """Archive files of ``table`` whose day range overlaps day_from..day_to."""
+    directory = _archive_dir(table)
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".jsonl.gz"):
+            continue
+        first, last = name[len(table) + 1:].split("_")[:2]
+        if first <= day_to.isoformat() and last >= day_from.isoformat():
+            yield os.path.join(directory, name)
+
+
+def _content(row, id_name):
+    return tuple(sorted((key, value) for key, value in row.items() if key != id_name))
+
+
+def restore(table, day_from, day_to):
+    """Put archived rows for day_from..day_to back into ``table``; returns the number restored."""
+    model, id_col, time_col, _, summary_key, load_existing, _, _, _ = LEDGERS[table]
+    id_name, time_name = id_col.key, time_col.key
+    columns = set(_columns(model))
+
+    rows = {}
+    for path in _archives(table, day_from, day_to):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                stamp = datetime.fromisoformat(row[time_name])
+                if day_from <= stamp.date() <= day_to:
+                    row[time_name] = stamp
+                    rows[row[id_name]] = {key: value for key, value in row.items() if key in columns}
+
+    in_range = (time_col >= datetime.combine(day_from, datetime.min.time()),
+                time_col < datetime.combine(day_to + timedelta(days=1), datetime.min.time()))
+    live = Counter(_content(row._asdict(), id_name)
+                   for row in db.session.query(*model.__table__.columns).filter(*in_range))
+    taken = set()
+    ids = list(rows)
+    for start in range(0, len(ids), 500):
+        taken.update(row_id for (row_id,) in db.session.query(id_col).filter(id_col.in_(ids[start:start + 500])))
+
+    missing = []
+    for row_id, row in rows.items():
+        content = _content(row, id_name)
+        if live[content]:
+            live[content] -= 1
+            continue
+        if row_id in taken:
+            row = {key: value for key, value in row.items() if key != id_name}
+        missing.append(row)
+    if missing:
+        db.session.bulk_insert_mappings(model, missing)
+        restored = {summary_key(row) for row in missing}
+        for key, summary in load_existing(day_from, day_to + timedelta(days=1)).items():
+            if key in restored:
+                db.session.delete(summary)
+    db.session.commit()
+    return len(missing)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact and archive ledger rows past the retention window.")
+    parser.add_argument("--table", choices=sorted(LEDGERS), action="append", help="default: all ledgers")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be archived")
+    parser.add_argument("--restore", nargs=2, metavar=("FROM", "TO"), help="restore YYYY-MM-DD..YYYY-MM-DD instead")
+    args = parser.parse_args(argv)
+
+    from app import app
+    with app.app_context():
+        for table in args.table or sorted(LEDGERS):
+            for shard in [None] if table in DIRECTORY_TABLES else known_shards():
+                with shard_scope(shard):
+                    name = f"{shard}:{table}" if shard else table
+                    if args.restore:
+                        day_from, day_to = (datetime.strptime(value, "%Y-%m-%d").date() for value in args.restore)
+                        print(f"✅ Restored {restore(table, day_from, day_to)} {name} row(s).")
+                        continue
+                    results = compact(table, dry_run=args.dry_run)
+                    for result in results:
+                        print(f"{'🔎' if args.dry_run else '📦'} {name} {result['from']}..{result['to']}: "
+                              f"{result['rows']} row(s) {result.get('file', '')}")
+                    if not results:
+                        print(f"✅ {name}: nothing past the retention window.")
+    return 0
+
+
+# Usage: python retention.py [--table stock_updates] [--dry-run] [--restore FROM TO]
+if __name__ == "__main__":
+    sys.exit(main())
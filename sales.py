@@ -1,11 +1,16 @@
 # sales.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, Response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, Response, stream_with_context
 from flask_login import login_required, current_user
-from models import db, Product, Sale, Price, Stock, StockUpdate
+from models import db, Product, Sale, Stock, StockSnapshot, AlcoholCategory, BottleVolume
+from pricing import prices_for_date
+from stock_snapshots import record_stock_changes, stock_at_start_of
+from sales_rollups import record_sales_deltas
+from page_cache import bump_org_version, conditional_page
+from reorder import refresh_low_stock
 from datetime import datetime, date
 from sqlalchemy.orm import joinedload
 from io import StringIO
-from sqlalchemy import func
+from sqlalchemy import func, select
 from datetime import timedelta
 
 import csv
@@ -17,8 +22,114 @@ def is_admin_or_manager():
     return current_user.is_authenticated and current_user.role in ["admin", "manager"]
 
 
+def post_sales(org_id, user_id, sale_date, quantities):
+    """Apply a day's sold quantities for an org.
+
+    ``quantities`` maps product_id -> quantity sold on ``sale_date``. Products,
+    stock and the day's sales are prefetched in a few set-based queries, only
+    rows whose quantity differs from what is stored are written, and prices
+    for those rows come from one batch lookup as of ``sale_date``. Returns
+    ``(changed_count, errors)``; the caller commits.
+    """
+    products = {
+        row.product_id: row for row in
+        db.session.query(Product.product_id, Product.product_name, Product.brand_id, Product.category_id)
+        .filter(Product.org_id == org_id)
+    }
+    stocks = {stock.product_id: stock for stock in Stock.query.filter_by(org_id=org_id)}
+    sales = {sale.product_id: sale for sale in Sale.query.filter_by(org_id=org_id, sale_date=sale_date)}
+
+    now = datetime.now()
+    sale_updates, sale_inserts, stock_updates, stock_inserts = [], [], [], []
+    priced = []  # (sale row, product_id, quantity, quantity_diff) waiting for a total
+    stock_changes = {}  # product_id -> (previous, new, sold) for the snapshots
+    errors = []
+
+    for product_id, quantity in quantities.items():
+        if product_id not in products:
+            continue  # 🔒 Skip products not belonging to current org
+
+        sale = sales.get(product_id)
+        previous_quantity = sale.quantity_sold if sale else 0
+        quantity_diff = quantity - previous_quantity
+        if quantity_diff == 0:
+            continue
+
+        stock = stocks.get(product_id)
+        current_stock = stock.quantity if stock else 0
+        if quantity_diff > current_stock:
+            errors.append(f"❌ Not enough stock for '{products[product_id].product_name}'. Available: {current_stock}, Tried to sell: {quantity_diff}.")
+            continue
+
+        if sale:
+            row = {
+                "sale_id": sale.sale_id,
+                "quantity_sold": quantity,
+                "sold_by": user_id,
+                "updated_at": now
+            }
+            sale_updates.append(row)
+        else:
+            row = {
+                "product_id": product_id,
+                "org_id": org_id,
+                "quantity_sold": quantity,
+                "sale_date": sale_date,
+                "sold_by": user_id,
+                "updated_at": now
+            }
+            sale_inserts.append(row)
+        priced.append((row, product_id, quantity, quantity_diff))
+
+        if stock:
+            new_stock = stock.quantity - quantity_diff
+            stock_updates.append({
+                "stock_id": stock.stock_id,
+                "quantity": new_stock,
+                "last_updated": now,
+                "last_updated_by": user_id
+            })
+        else:
+            new_stock = max(0 - quantity_diff, 0)
+            stock_inserts.append({
+                "product_id": product_id,
+                "org_id": org_id,
+                "quantity": new_stock,
+                "last_updated": now,
+                "last_updated_by": user_id
+            })
+        stock_changes[product_id] = (current_stock, new_stock, quantity_diff)
+
+    prices = prices_for_date(org_id, [product_id for _, product_id, _, _ in priced], sale_date)
+    rollup_lines = []
+    for row, product_id, quantity, quantity_diff in priced:
+        row["total_price"] = quantity * prices.get(product_id, 0.00)
+        sale = sales.get(product_id)
+        previous_total = float(sale.total_price) if sale else 0.00
+        product = products[product_id]
+        rollup_lines.append((sale_date, product.brand_id, product.category_id,
+                             quantity_diff, row["total_price"] - previous_total))
+
+    if sale_updates:
+        db.session.bulk_update_mappings(Sale, sale_updates)
+    if sale_inserts:
+        db.session.bulk_insert_mappings(Sale, sale_inserts)
+    if stock_updates:
+        db.session.bulk_update_mappings(Stock, stock_updates)
+    if stock_inserts:
+        db.session.bulk_insert_mappings(Stock, stock_inserts)
+    record_stock_changes(org_id, sale_date, stock_changes)
+    record_sales_deltas(org_id, rollup_lines)
+    refresh_low_stock(org_id, stock_changes)
+    if priced:
+        bump_org_version(org_id)
+
+    return len(sale_updates) + len(sale_inserts), errors
+
+
 @sales_bp.route("/sales", methods=["GET", "POST"])
 @login_required
+@conditional_page
 def manage_sales():
     if not is_admin_or_manager():
         flash("Admins and Managers only!")
@@ -60,72 +171,21 @@ def update_sales():
         sale_date = request.form.get("sale_date") or date.today().strftime("%Y-%m-%d")
         sale_date = datetime.strptime(sale_date, "%Y-%m-%d").date()
 
-        any_updates = False
-        errors = []
-
+        quantities = {}
         for key, value in request.form.items():
             if key.startswith("quantity_"):
                 product_id = int(key.split("_")[1])
                 quantity = int(value)
+                if quantity >= 0:
+                    quantities[product_id] = quantity
+
+        changed, errors = post_sales(current_user.org_id, current_user.user_id, sale_date, quantities)
 
-                if quantity < 0:
-                    continue
-
-                product = Product.query.get(product_id)
-                if not product or product.org_id != current_user.org_id:
-                    continue
-
-                stock = Stock.query.filter_by(product_id=product_id, org_id=current_user.org_id).first()
-                current_stock = stock.quantity if stock else 0
-
-                sale = Sale.query.filter_by(product_id=product_id, sale_date=sale_date, org_id=current_user.org_id).first()
-                previous_quantity = sale.quantity_sold if sale else 0
-                quantity_diff = quantity - previous_quantity
-
-                if quantity_diff > current_stock:
-                    errors.append(f"❌ Not enough stock for '{product.product_name}'. Available: {current_stock}, Tried to sell: {quantity_diff}.")
-                    continue
-
-                # Update sale
-                price_obj = Price.query.filter_by(product_id=product_id).order_by(Price.effective_date.desc()).first()
-                price = float(price_obj.price) if price_obj else 0.00
-                total = quantity * price
-
-                if sale:
-                    sale.quantity_sold = quantity
-                    sale.total_price = total
-                    sale.sold_by = current_user.user_id
-                else:
-                    sale = Sale(
-                        product_id=product_id,
-                        org_id=current_user.org_id,
-                        quantity_sold=quantity,
-                        total_price=total,
-                        sale_date=sale_date,
-                        sold_by=current_user.user_id
-                    )
-                    db.session.add(sale)
-
-                # Update stock
-                if stock:
-                    stock.quantity -= quantity_diff
-                    stock.last_updated = datetime.now()
-                    stock.last_updated_by = current_user.user_id
-                else:
-                    stock = Stock(
-                        product_id=product_id,
-                        org_id=current_user.org_id,
-                        quantity=max(0 - quantity_diff, 0),
-                        last_updated=datetime.now(),
-                        last_updated_by=current_user.user_id
-                    )
-                    db.session.add(stock)
-
-                any_updates = True
-
-        if any_updates:
+        if changed:
             db.session.commit()
             flash("✅ Sales updated successfully.")
+        elif not errors:
+            flash("No sales changes to save.")
         if errors:
             for err in errors:
                 flash(err)
@@ -137,72 +197,112 @@ def update_sales():
 
     return redirect(url_for("sales.manage_sales", date=sale_date.strftime("%Y-%m-%d")))
 
+def _csv_line(row):
+    si = StringIO()
+    csv.writer(si).writerow(row)
+    return si.getvalue()
+
+
+@sales_bp.route('/sales/download_csv')
 @sales_bp.route('/sales/download_csv/<selected_date>')
 @login_required
-def download_csv(selected_date):
+def download_csv(selected_date=None):
     if not is_admin_or_manager():
         flash("Admins and Managers only!")
         return redirect(url_for('inventory.inventory'))
 
     try:
-        selected_date = datetime.strptime(selected_date, "%Y-%m-%d").date()
-        org_id = current_user.org_id
-        sales = (
-            Sale.query
-            .filter_by(org_id=org_id, sale_date=selected_date)
-            .join(Sale.product)
-            .join(Product.category)
-            .join(Product.volume)
-            .order_by(Product.product_name)
-            .all()
+        date_from = selected_date or request.args.get("from")
+        date_to = selected_date or request.args.get("to") or date_from
+        date_from = datetime.strptime(date_from, "%Y-%m-%d").date()
+        date_to = datetime.strptime(date_to, "%Y-%m-%d").date()
+        if date_to < date_from:
+            date_from, date_to = date_to, date_from
+    except (TypeError, ValueError):
+        flash("Invalid date range.")
+        return redirect(url_for("sales.manage_sales"))
+
+    org_id = current_user.org_id
+    multi_day = date_from != date_to
+
+    sales_in_range = Sale.query.filter(
+        Sale.org_id == org_id, Sale.sale_date >= date_from, Sale.sale_date <= date_to
+    )
+    if not db.session.query(sales_in_range.exists()).scalar():
+        flash("No sales found for this date." if not multi_day else "No sales found for this date range.")
+        return redirect(url_for("sales.manage_sales"))
+
+    def generate():
+        header = ["Product", "Category", "Volume (ml)", "Previous Stock", "Quantity Sold", "Present Stock", "Total Price ($)"]
+        yield _csv_line(["Date"] + header if multi_day else header)
+
+        # Opening stock for the first day, then walk the day's snapshots
+        # forward alongside the sales; both are single indexed range reads.
+        stock_levels = stock_at_start_of(org_id, date_from)
+        snapshots = db.session.execute(
+            select(StockSnapshot.snapshot_date, StockSnapshot.product_id,
+                   StockSnapshot.opening_quantity, StockSnapshot.closing_quantity)
+            .where(StockSnapshot.org_id == org_id,
+                   StockSnapshot.snapshot_date >= date_from,
+                   StockSnapshot.snapshot_date <= date_to)
+            .order_by(StockSnapshot.snapshot_date)
+            .execution_options(yield_per=1000)
+        )
+        rows = db.session.execute(
+            select(Sale.sale_date, Sale.product_id, Sale.quantity_sold, Sale.total_price,
+                   Product.product_name, AlcoholCategory.category_name, BottleVolume.volume_ml)
+            .join(Product, Product.product_id == Sale.product_id)
+            .join(AlcoholCategory, AlcoholCategory.category_id == Product.category_id)
+            .join(BottleVolume, BottleVolume.volume_id == Product.volume_id)
+            .where(Sale.org_id == org_id, Sale.sale_date >= date_from, Sale.sale_date <= date_to)
+            .order_by(Sale.sale_date, Product.product_name)
+            .execution_options(yield_per=1000)
         )
-
-        if not sales:
-            flash("No sales found for this date.")
-            return redirect(url_for("sales.manage_sales"))
-
-        # Create CSV
-        si = StringIO()
-        writer = csv.writer(si)
-        writer.writerow(["Product", "Category", "Volume (ml)", "Previous Stock", "Quantity Sold", "Present Stock", "Total Price ($)"])
 
         total_amount = 0
-
-        for sale in sales:
-            # Get previous day's stock (fallback to current if not found)
-            previous_stock_entry = (
-                StockUpdate.query
-                .filter_by(product_id=sale.product_id)
-                .filter(StockUpdate.update_time < selected_date)
-                .order_by(StockUpdate.update_time.desc())
-                .first()
-            )
-
-            previous_stock = previous_stock_entry.new_quantity if previous_stock_entry else sale.quantity_sold + 0  # fallback
-
-            present_stock = previous_stock - sale.quantity_sold
-            total_amount += float(sale.total_price)
-
-            writer.writerow([
-                sale.product.product_name,
-                sale.product.category.category_name,
-                sale.product.volume.volume_ml,
-                previous_stock,
-                sale.quantity_sold,
-                present_stock,
-                f"{float(sale.total_price):.2f}"
-            ])
-
-        writer.writerow([])
-        writer.writerow(["", "", "", "", "", "Total", f"{total_amount:.2f}"])
-
-        output = si.getvalue()
-        return Response(
-            output,
-            mimetype="text/csv",
-            headers={"Content-Disposition": f"attachment;filename=sales_{selected_date}.csv"}
-        )
-    except Exception as e:
-        print(f"[CSV Download Error] {e}")
-        flash("Error generating CSV.")
-        return redirect(url_for("sales.manage_sales"))
\ No newline at end of file
+        current_day = None
+        closing_levels = {}
+        try:
+            pending = snapshots.fetchone()
+            for sale_date, product_id, quantity_sold, total_price, product_name, category_name, volume_ml in rows:
+                if sale_date != current_day:
+                    current_day = sale_date
+                    stock_levels.update(closing_levels)
+                    closing_levels = {}
+                    while pending is not None and pending.snapshot_date <= sale_date:
+                        if pending.snapshot_date < sale_date:
+                            stock_levels[pending.product_id] = pending.closing_quantity
+                        else:
+                            stock_levels[pending.product_id] = pending.opening_quantity
+                            closing_levels[pending.product_id] = pending.closing_quantity
+                        pending = snapshots.fetchone()
+
+                # Fallback when the product has no snapshot history at all
+                previous_stock = stock_levels.get(product_id, quantity_sold + 0)
+                present_stock = closing_levels.get(product_id, previous_stock - quantity_sold)
+                total_amount += float(total_price)
+
+                row = [
+                    product_name,
+                    category_name,
+                    volume_ml,
+                    previous_stock,
+                    quantity_sold,
+                    present_stock,
+                    f"{float(total_price):.2f}"
+                ]
+                yield _csv_line([sale_date.strftime("%Y-%m-%d")] + row if multi_day else row)
+        finally:
+            # A half-read SQLite cursor keeps its read lock, so always close both
+            snapshots.close()
+            rows.close()
+
+        yield _csv_line([])
+        yield _csv_line([""] * (6 if multi_day else 5) + ["Total", f"{total_amount:.2f}"])
+
+    filename = f"sales_{date_from}.csv" if not multi_day else f"sales_{date_from}_to_{date_to}.csv"
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
+    )
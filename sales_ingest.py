@@ -0,0 +1,230 @@
+import codecs
+import csv
+import json
+from collections import defaultdict
+from datetime import datetime, date
+from sqlalchemy import case, inspect
+from sqlalchemy.exc import IntegrityError
+from models import db, Product, Stock, Sale, IngestBatch
+from pricing import prices_for_date
+from stock_snapshots import record_stock_changes
+from sales_rollups import record_sales_deltas
+from page_cache import bump_org_version
+from reorder import refresh_low_stock
+
+# Bulk sales ingestion for POS terminals. A request body is a stream of sale
+# lines (NDJSON objects or CSV rows with a header) carrying product_id,
+# quantity (negative for a void/return) and an optional sale_date. The
+# stream is cut into batches of INGEST_BATCH_SIZE lines, and each batch
+# commits in its own transaction under "<Idempotency-Key>:<batch number>".
+# A retried request replays the stored results of batches that already
+# committed, so no line is applied twice. Within a batch, lines are checked
+# in order against running stock. Accepted lines add to that day's Sale row
+# for the product, as the /sales form does, and stock is decremented by one
+# set-based UPDATE.
+
+DEFAULT_BATCH_SIZE = 1000
+REQUIRED_FIELDS = ("product_id", "quantity")
+
+
+def ensure_ingest_batches():
+    """Create the idempotency table on databases that predate it."""
+    inspector = inspect(db.engine)
+    if inspector.has_table(Product.__tablename__) and not inspector.has_table(IngestBatch.__tablename__):
+        IngestBatch.__table__.create(db.engine, checkfirst=True)
+
+
+def _parse_line(fields):
+    product_id = int(fields["product_id"])
+    quantity = int(fields["quantity"])
+    sale_date = fields.get("sale_date")
+    if sale_date in (None, ""):
+        sale_date = date.today()
+    else:
+        sale_date = datetime.strptime(str(sale_date), "%Y-%m-%d").date()
+    if quantity == 0:
+        raise ValueError("quantity must not be 0")
+    return product_id, quantity, sale_date
+
+
+def read_lines(stream, content_type):
+    """Yield (line_number, parsed line or None, error or None) from a byte stream."""
+    text = codecs.iterdecode(stream, "utf-8-sig")
+    if "csv" in (content_type or ""):
+        reader = csv.DictReader(text)
+        missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or [])]
+        if missing:
+            yield 1, None, f"CSV header must include {', '.join(REQUIRED_FIELDS)}"
+            return
+        records = ((reader.line_num, row) for row in reader)
+    else:
+        records = ((number, line) for number, line in enumerate(_split_lines(text), start=1) if line.strip())
+
+    for number, record in records:
+        try:
+            fields = json.loads(record) if isinstance(record, str) else record
+            if not isinstance(fields, dict):
+                raise ValueError("expected a JSON object")
+            yield number, _parse_line(fields), None
+        except (KeyError, TypeError, ValueError) as e:
+            yield number, None, f"Invalid line: {e}"
+
+
+def _split_lines(chunks):
+    pending = ""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split("\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def batches(lines, size):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _apply_batch(org_id, user_id, lines):
+    """Check lines in order against running stock and write the accepted ones; returns per-line results."""
+    parsed = [(number, line) for number, line, error in lines if line]
+    product_ids = {product_id for _, (product_id, _, _) in parsed}
+    days = {sale_date for _, (_, _, sale_date) in parsed}
+
+    products = {
+        row.product_id: row for row in
+        db.session.query(Product.product_id, Product.product_name, Product.brand_id, Product.category_id)
+        .filter(Product.org_id == org_id, Product.product_id.in_(product_ids))
+    } if product_ids else {}
+    stocks = {
+        row.product_id: row for row in
+        db.session.query(Stock.stock_id, Stock.product_id, Stock.quantity)
+        .filter(Stock.org_id == org_id, Stock.product_id.in_(list(products)))
+    } if products else {}
+    sales = {
+        (row.product_id, row.sale_date): row for row in
+        db.session.query(Sale.sale_id, Sale.product_id, Sale.sale_date, Sale.quantity_sold, Sale.total_price)
+        .filter(Sale.org_id == org_id, Sale.product_id.in_(list(products)), Sale.sale_date.in_(days))
+    } if products else {}
+
+    level = {product_id: (stocks[product_id].quantity if product_id in stocks else 0) for product_id in products}
+    sold = {key: row.quantity_sold for key, row in sales.items()}
+    results = []
+    accepted = defaultdict(int)  # (product_id, sale_date) -> units added
+    for number, line, error in lines:
+        if error:
+            results.append({"line": number, "status": "error", "error": error})
+            continue
+        product_id, quantity, sale_date = line
+        product = products.get(product_id)
+        if product is None:
+            results.append({"line": number, "status": "rejected", "error": f"Unknown product {product_id}"})
+            continue
+        key = (product_id, sale_date)
+        if quantity > level[product_id]:
+            results.append({"line": number, "status": "rejected", "error":
+                            f"Not enough stock for '{product.product_name}'. Available: {level[product_id]}, Tried to sell: {quantity}."})
+            continue
+        if sold.get(key, 0) + quantity < 0:
+            results.append({"line": number, "status": "rejected", "error":
+                            f"Cannot void {-quantity} of '{product.product_name}' on {sale_date}; only {sold.get(key, 0)} sold."})
+            continue
+        level[product_id] -= quantity
+        sold[key] = sold.get(key, 0) + quantity
+        accepted[key] += quantity
+        results.append({"line": number, "status": "ok"})
+
+    accepted = {key: units for key, units in accepted.items() if units}
+    if not accepted:
+        return results
+
+    now = datetime.now()
+    by_day = defaultdict(list)
+    for product_id, sale_date in accepted:
+        by_day[sale_date].append(product_id)
+    prices = {day: prices_for_date(org_id, product_ids, day) for day, product_ids in by_day.items()}
+
+    sale_updates, sale_inserts, rollup_lines = [], [], []
+    for (product_id, sale_date), units in accepted.items():
+        sale = sales.get((product_id, sale_date))
+        quantity = sold[product_id, sale_date]
+        total = quantity * prices[sale_date].get(product_id, 0.00)
+        previous_total = float(sale.total_price) if sale else 0.00
+        if sale:
+            sale_updates.append({"sale_id": sale.sale_id, "quantity_sold": quantity, "total_price": total,
+                                 "sold_by": user_id, "updated_at": now})
+        else:
+            sale_inserts.append({"product_id": product_id, "org_id": org_id, "quantity_sold": quantity,
+                                 "total_price": total, "sale_date": sale_date, "sold_by": user_id,
+                                 "updated_at": now})
+        product = products[product_id]
+        rollup_lines.append((sale_date, product.brand_id, product.category_id, units, total - previous_total))
+
+    if sale_updates:
+        db.session.bulk_update_mappings(Sale, sale_updates)
+    if sale_inserts:
+        db.session.bulk_insert_mappings(Sale, sale_inserts)
+
+    decrements = defaultdict(int)
+    for (product_id, _), units in accepted.items():
+        decrements[product_id] += units
+    existing = {product_id: units for product_id, units in decrements.items() if product_id in stocks and units}
+    if existing:
+        Stock.query.filter(
+            Stock.org_id == org_id,
+            Stock.stock_id.in_([stocks[product_id].stock_id for product_id in existing])
+        ).update({
+            Stock.quantity: Stock.quantity - case(existing, value=Stock.product_id, else_=0),
+            Stock.last_updated: now,
+            Stock.last_updated_by: user_id
+        }, synchronize_session=False)
+    # Voids of products without a stock row put the units back on a new row
+    returned = [{"product_id": product_id, "org_id": org_id, "quantity": -units, "last_updated": now,
+                 "last_updated_by": user_id}
+                for product_id, units in decrements.items() if product_id not in stocks and units < 0]
+    if returned:
+        db.session.bulk_insert_mappings(Stock, returned)
+
+    # Snapshots take each day's change in date order, chained from the stock level before the batch
+    running = {product_id: (stocks[product_id].quantity if product_id in stocks else 0) for product_id in decrements}
+    for sale_date in sorted(by_day):
+        changes = {}
+        for product_id in by_day[sale_date]:
+            units = accepted[product_id, sale_date]
+            changes[product_id] = (running[product_id], running[product_id] - units, units)
+            running[product_id] -= units
+        record_stock_changes(org_id, sale_date, changes)
+    record_sales_deltas(org_id, rollup_lines)
+    refresh_low_stock(org_id, decrements)
+    bump_org_version(org_id)
+    return results
+
+
+def ingest_batch(org_id, user_id, key, lines):
+    """Apply one batch exactly once under ``key``; returns (results, replayed)."""
+    stored = IngestBatch.query.filter_by(org_id=org_id, idempotency_key=key).first()
+    if stored:
+        return json.loads(stored.result), True
+
+    try:
+        results = _apply_batch(org_id, user_id, lines)
+        db.session.add(IngestBatch(
+            org_id=org_id, idempotency_key=key, line_count=len(lines), created_by=user_id,
+            accepted_count=sum(1 for result in results if result["status"] == "ok"),
+            result=json.dumps(results, separators=(",", ":"))
+        ))
+        db.session.commit()
+        return results, False
+    except IntegrityError:
+        # A concurrent retry committed this batch first; hand back its results
+        db.session.rollback()
+        stored = IngestBatch.query.filter_by(org_id=org_id, idempotency_key=key).first()
+        if stored is None:
+            raise
+        return json.loads(stored.result), True
@@ -0,0 +1,175 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from sqlalchemy import func, inspect, or_, and_
+from models import db, Sale, Product, SalesRollup, Organization
+
+# Per-org sales totals pre-aggregated by day, ISO week (Monday start) and
+# month, each overall and broken down by category and by brand. update_sales
+# folds its deltas in as it posts; rebuild_sales_rollups recomputes an org
+# from the sales table. Sales are rolled up under their product's current
+# brand and category, so an edit that changes either moves the product's
+# sales history with move_product_sales.
+
+PERIODS = ("day", "week", "month")
+
+
+def period_start(period, day):
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _rollup_keys(day, brand_id, category_id):
+    for period in PERIODS:
+        start = period_start(period, day)
+        yield period, start, "total", 0
+        yield period, start, "category", category_id
+        yield period, start, "brand", brand_id
+
+
+def _aggregate(lines):
+    """Sum (day, brand_id, category_id, units, revenue) lines into rollup keys."""
+    totals = defaultdict(lambda: [0, 0.0])
+    for day, brand_id, category_id, units, revenue in lines:
+        for key in _rollup_keys(day, brand_id, category_id):
+            totals[key][0] += units
+            totals[key][1] += revenue
+    return totals
+
+
+def record_sales_deltas(org_id, lines):
+    """Fold sale changes into the rollups; the caller commits.
+
+    ``lines`` are (sale_date, brand_id, category_id, units_delta,
+    revenue_delta) tuples. Existing rollup rows for the affected periods are
+    read in one query, then updated and inserted in bulk.
+    """
+    totals = _aggregate(lines)
+    if not totals:
+        return
+
+    periods = {(period, start) for period, start, _, _ in totals}
+    existing = {
+        (row.period, row.period_start, row.dimension, row.dimension_id): row
+        for row in SalesRollup.query.filter(
+            SalesRollup.org_id == org_id,
+            or_(*(and_(SalesRollup.period == period, SalesRollup.period_start == start) for period, start in periods))
+        )
+    }
+
+    updates, inserts = [], []
+    for key, (units, revenue) in totals.items():
+        row = existing.get(key)
+        if row:
+            updates.append({
+                "rollup_id": row.rollup_id,
+                "units": row.units + units,
+                "revenue": round(float(row.revenue) + revenue, 2)
+            })
+        else:
+            period, start, dimension, dimension_id = key
+            inserts.append({
+                "org_id": org_id,
+                "period": period,
+                "period_start": start,
+                "dimension": dimension,
+                "dimension_id": dimension_id,
+                "units": units,
+                "revenue": round(revenue, 2)
+            })
+
+    if updates:
+        db.session.bulk_update_mappings(SalesRollup, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(SalesRollup, inserts)
+
+
+def move_product_sales(org_id, product_id, old_brand_id, old_category_id, brand_id, category_id):
+    """Re-key a product's rolled-up sales after its brand or category changed; the caller commits."""
+    if (old_brand_id, old_category_id) == (brand_id, category_id):
+        return
+    days = (
+        db.session.query(Sale.sale_date, func.sum(Sale.quantity_sold), func.sum(Sale.total_price))
+        .filter(Sale.org_id == org_id, Sale.product_id == product_id)
+        .group_by(Sale.sale_date)
+    )
+    lines = []
+    for day, units, revenue in days:
+        units, revenue = int(units or 0), float(revenue or 0)
+        lines.append((day, old_brand_id, old_category_id, -units, -revenue))
+        lines.append((day, brand_id, category_id, units, revenue))
+    record_sales_deltas(org_id, lines)
+
+
+def rebuild_sales_rollups(org_id):
+    """Recompute an org's rollups from the sales table; the caller commits."""
+    SalesRollup.query.filter_by(org_id=org_id).delete(synchronize_session=False)
+    lines = (
+        db.session.query(Sale.sale_date, Product.brand_id, Product.category_id,
+                         func.sum(Sale.quantity_sold), func.sum(Sale.total_price))
+        .join(Product, Product.product_id == Sale.product_id)
+        .filter(Sale.org_id == org_id)
+        .group_by(Sale.sale_date, Product.brand_id, Product.category_id)
+    )
+    totals = _aggregate(
+        (day, brand_id, category_id, int(units or 0), float(revenue or 0))
+        for day, brand_id, category_id, units, revenue in lines
+    )
+    db.session.bulk_insert_mappings(SalesRollup, [
+        {"org_id": org_id, "period": period, "period_start": start, "dimension": dimension,
+         "dimension_id": dimension_id, "units": units, "revenue": round(revenue, 2)}
+        for (period, start, dimension, dimension_id), (units, revenue) in totals.items()
+    ])
+
+
+def ensure_sales_rollups():
+    """Create and backfill the rollup table on databases that predate it."""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(Sale.__tablename__) or inspector.has_table(SalesRollup.__tablename__):
+        return
+    SalesRollup.__table__.create(db.engine, checkfirst=True)
+    for (org_id,) in db.session.query(Organization.org_id):
+        rebuild_sales_rollups(org_id)
+    db.session.commit()
+
+
+def _series(org_id, period, dimension, since):
+    return (
+        db.session.query(SalesRollup.period_start, SalesRollup.dimension_id, SalesRollup.units, SalesRollup.revenue)
+        .filter(SalesRollup.org_id == org_id, SalesRollup.period == period,
+                SalesRollup.period_start >= since, SalesRollup.dimension == dimension)
+        .order_by(SalesRollup.period_start)
+        .all()
+    )
+
+
+def dashboard_data(org_id, today=None, months=12, top=10):
+    """Trend and breakdown series for the dashboard, read straight from the rollups."""
+    today = today or date.today()
+    month_start = period_start("month", today)
+    for _ in range(months - 1):
+        month_start = period_start("month", month_start - timedelta(days=1))
+    week_start = period_start("week", today) - timedelta(weeks=11)
+    day_start = today - timedelta(days=29)
+
+    def totals(period, since):
+        return [(start, units, float(revenue)) for start, _, units, revenue in _series(org_id, period, "total", since)]
+
+    def breakdown(dimension):
+        sums = defaultdict(lambda: [0, 0.0])
+        for _, dimension_id, units, revenue in _series(org_id, "month", dimension, month_start):
+            sums[dimension_id][0] += units
+            sums[dimension_id][1] += float(revenue)
+        ranked = sorted(sums.items(), key=lambda item: item[1][1], reverse=True)
+        return [(dimension_id, units, revenue) for dimension_id, (units, revenue) in ranked[:top]]
+
+    return {
+        "monthly": totals("month", month_start),
+        "weekly": totals("week", week_start),
+        "daily": totals("day", day_start),
+        "by_category": breakdown("category"),
+        "by_brand": breakdown("brand"),
+        "since": month_start,
+    }
@@ -0,0 +1,121 @@
+import sys
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models import db, LowStock, Stock, StockUpdate
+from reorder import low_stock_statements
+
+# Non-destructive schema upgrade. db.create_all() only adds missing tables,
+# and the ensure_* hooks add the columns and derived tables newer code
+# relies on. ensure_indexes then creates every index declared in models.py
+# that an existing table lacks. Unique indexes are created the same way. If
+# existing rows already break one, the index's DEDUPE step (if any) merges
+# them and the index is created; otherwise it is skipped and reported rather
+# than rows being changed, so resolve the duplicates and run again.
+
+
+def _dedupe_stock(conn):
+    """Keep the most recently updated stock row per (org_id, product_id).
+
+    low_stock counted a product's duplicate rows together, so each removed
+    row is logged in stock_updates as that total dropping by its quantity,
+    and low_stock is recomputed for the merged products.
+    """
+    rows = conn.execute(text(
+        "SELECT stock_id, org_id, product_id, quantity FROM stock WHERE (org_id, product_id) IN ("
+        " SELECT org_id, product_id FROM stock GROUP BY org_id, product_id HAVING COUNT(*) > 1)"
+        " ORDER BY org_id, product_id, last_updated DESC, stock_id DESC"
+    )).all()
+    duplicates = defaultdict(list)
+    for row in rows:
+        duplicates[(row.org_id, row.product_id)].append(row)
+
+    now = datetime.now()
+    removed, ledger, merged = [], [], defaultdict(list)
+    for (org_id, product_id), (kept, *extra) in duplicates.items():
+        running = kept.quantity + sum(row.quantity for row in extra)
+        for row in extra:
+            removed.append(row.stock_id)
+            ledger.append({"product_id": product_id, "previous_quantity": running,
+                           "new_quantity": running - row.quantity, "update_time": now, "updated_by": None})
+            running -= row.quantity
+        merged[org_id].append(product_id)
+
+    if removed:
+        conn.execute(Stock.__table__.delete().where(Stock.stock_id.in_(removed)))
+        conn.execute(StockUpdate.__table__.insert(), ledger)
+    if inspect(conn).has_table(LowStock.__tablename__):
+        for org_id, product_ids in merged.items():
+            for statement in low_stock_statements(org_id, product_ids):
+                conn.execute(statement)
+    return len(removed)
+
+
+DEDUPE = {"uq_stock_org_product": _dedupe_stock}
+
+
+def ensure_indexes(engine=None):
+    """Create declared indexes missing from existing tables; returns [(table, index, status)]."""
+    engine = engine or db.engine
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    results = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        present = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in present:
+                continue
+            try:
+                index.create(engine)
+                results.append((table.name, index.name, "created"))
+            except IntegrityError as e:
+                if index.name not in DEDUPE:
+                    print(f"[Schema Upgrade] Skipped unique index {index.name}: existing rows conflict ({e.orig})")
+                    results.append((table.name, index.name, "skipped: duplicate rows"))
+                    continue
+                with engine.begin() as conn:
+                    removed = DEDUPE[index.name](conn)
+                    index.create(conn)
+                print(f"[Schema Upgrade] Merged {removed} duplicate {table.name} row(s) to create {index.name}")
+                results.append((table.name, index.name, f"created after merging {removed} duplicate row(s)"))
+            except OperationalError as e:
+                print(f"[Schema Upgrade] Could not create {index.name} yet: {e.orig}")
+                results.append((table.name, index.name, "failed"))
+    return results
+
+
+def missing_indexes(engine=None):
+    inspector = inspect(engine or db.engine)
+    tables = set(inspector.get_table_names())
+    return [
+        (table.name, index.name) for table in db.metadata.sorted_tables if table.name in tables
+        for index in table.indexes if index.name not in {found["name"] for found in inspector.get_indexes(table.name)}
+    ]
+
+
+def main():
+    # Importing the app runs every ensure_* hook, ensure_indexes included;
+    # create_all then adds any table still missing, with its indexes. Opening
+    # each tenant shard does the same for the shard (see sharding.py).
+    from app import app
+    from sharding import create_directory, known_shards, shard_engine
+    with app.app_context():
+        create_directory()
+        missing = missing_indexes()
+        for shard in known_shards():
+            if shard is not None:
+                missing += [(f"{shard}:{table}", index) for table, index in missing_indexes(shard_engine(shard))]
+    for table, index in missing:
+        print(f"⚠️ {table}.{index} is still missing")
+    if missing:
+        return 1
+    print("✅ Schema is up to date.")
+    return 0
+
+
+# Usage: python schema_upgrade.py
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import re
+from sqlalchemy import Float, Integer, bindparam, select, text
+from sqlalchemy.exc import OperationalError
+from models import db, Product, Brand, AlcoholCategory
+
+# SQLite FTS5 index over product name, brand and category. The rowid is the
+# product_id, so results join straight back to products. On engines without
+# FTS5 every function here is a no-op and search_matches returns None,
+# which tells callers to fall back to a plain ILIKE filter.
+SEARCH_TABLE = "product_search"
+
+_available = {}
+
+
+def _create_index(conn):
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "product_name, brand_name, category_name, org_id UNINDEXED, "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+
+
+def search_available(engine=None):
+    """Create the index on first use; False when the engine has no FTS5.
+
+    Called once at app startup, and when a tenant shard is opened, so the
+    index is never built from inside a request's write transaction. The
+    engine defaults to the one the session routes product queries to.
+    """
+    engine = engine or db.session.get_bind()
+    key = str(engine.url)
+    if key not in _available:
+        if engine.dialect.name != "sqlite":
+            _available[key] = False
+        else:
+            try:
+                with engine.begin() as conn:
+                    tables = {name for (name,) in conn.execute(text("SELECT name FROM sqlite_master"))}
+                    if Product.__tablename__ not in tables:
+                        return False  # Schema not created yet; try again later
+                    if SEARCH_TABLE not in tables:
+                        _create_index(conn)
+                        _fill(conn, None)
+                _available[key] = True
+            except OperationalError as e:
+                if "fts5" not in str(e):
+                    print(f"[Search Index] Could not build index yet: {e}")
+                    return False  # e.g. database locked; try again later
+                print(f"[Search Index] FTS5 unavailable, falling back to LIKE: {e}")
+                _available[key] = False
+    return _available[key]
+
+
+def _fill(conn, product_ids):
+    query = (
+        select(Product.product_id, Product.product_name, Brand.brand_name,
+               AlcoholCategory.category_name, Product.org_id)
+        .join(Brand, Brand.brand_id == Product.brand_id)
+        .join(AlcoholCategory, AlcoholCategory.category_id == Product.category_id)
+    )
+    if product_ids is not None:
+        query = query.where(Product.product_id.in_(product_ids))
+    rows = [
+        {"rowid": pid, "product_name": name, "brand_name": brand, "category_name": category, "org_id": org_id}
+        for pid, name, brand, category, org_id in conn.execute(query)
+    ]
+    if rows:
+        conn.execute(text(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, product_name, brand_name, category_name, org_id) "
+            "VALUES (:rowid, :product_name, :brand_name, :category_name, :org_id)"
+        ), rows)
+
+
+def remove_products(product_ids):
+    """Drop products from the index; the caller commits."""
+    product_ids = list(product_ids)
+    if product_ids and search_available():
+        db.session.execute(
+            text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN :ids").bindparams(
+                bindparam("ids", expanding=True)),
+            {"ids": product_ids}
+        )
+
+
+def index_products(product_ids):
+    """(Re)index the given products from the current session state; the caller commits."""
+    product_ids = list(product_ids)
+    if product_ids and search_available():
+        remove_products(product_ids)
+        _fill(db.session, product_ids)
+
+
+def rebuild_index():
+    """Recreate the whole index from the products table."""
+    if search_available():
+        db.session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+        _fill(db.session, None)
+        db.session.commit()
+
+
+def _match_expression(term):
+    # Every token must match (implicit AND), each as a prefix
+    tokens = re.findall(r"\w+", term.lower())
+    return " ".join(f'"{token}"*' for token in tokens)
+
+
+def search_matches(org_id, term):
+    """Subquery of (product_id, rank) for every product in ``org_id`` matching ``term``.
+
+    Lower ranks are better matches. Join it to products to filter, count and
+    page through all matches in SQL. Returns None when no index is available
+    so callers can fall back.
+    """
+    if not search_available():
+        return None
+    expression = _match_expression(term)
+    if not expression:
+        query = text("SELECT NULL AS product_id, NULL AS rank WHERE 0")
+    else:
+        # LIMIT -1 (no limit) stops SQLite flattening the subquery into one MATCH per product row
+        query = text(
+            f"SELECT rowid AS product_id, bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0) AS rank FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH :expression AND org_id = :org_id LIMIT -1"
+        ).bindparams(expression=expression, org_id=org_id)
+    return query.columns(product_id=Integer, rank=Float).subquery("search_matches")
@@ -0,0 +1,323 @@
+import argparse
+import os
+import sys
+import threading
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import sqlalchemy as sa
+from flask import current_app, g, has_request_context
+from flask_login import current_user
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.util import find_tables
+from db_engine import engine_options
+
+# Optional per-tenant databases (TENANT_SHARDING in config.py). With sharding
+# off, everything lives in SQLALCHEMY_DATABASE_URI as before. With it on,
+# that database becomes the directory: organizations, users and the audit
+# log, which login and user management need before any tenant is known.
+# Every other table lives in a tenant database named by
+# TENANT_DATABASE_URL, one per shard:
+#
+#   * "org": one database per organization (shard "org_<org_id>")
+#   * "hash": TENANT_SHARD_COUNT databases, the org id hashed onto one
+#     ("shard_<n>"); changing the count moves orgs, so it is fixed once set
+#
+# TenantSession.get_bind routes each statement. Statements on directory
+# tables go to the directory engine. Anything else goes to the current
+# shard: the one set by tenant_scope/shard_scope (CLIs, maintenance), or
+# else the logged-in user's org. A tenant statement with neither raises
+# instead of guessing. One session only ever talks to one shard at a time:
+# the scopes close the session on exit, so commit inside them.
+#
+# A shard is opened on first use in each process. Its tables are created
+# from the models and the on_shard_open hooks run (missing indexes, the
+# search index), so new shards start at the current schema. SQLite allows one
+# writer per file, so writers of different shards no longer wait on each
+# other. A transaction touching the directory and a shard, e.g. a stock
+# write plus its audit row, commits them one after the other, not atomically.
+#
+# Turning sharding on for a database that ran unsharded leaves every tenant
+# row in what is now the directory, so the app refuses to start until
+# "python sharding.py migrate" has copied each org's rows into its shard.
+
+DIRECTORY_TABLES = frozenset({"organizations", "users", "user_action_logs", "user_action_days"})
+
+_scope = ContextVar("tenant_shard", default=None)
+_engines = {}
+_engines_lock = threading.Lock()
+_on_open = []
+_migrating = False
+MIGRATE_CHUNK_SIZE = 5000
+
+
+def sharding_enabled(config=None):
+    return bool((config or current_app.config).get("TENANT_SHARDING"))
+
+
+def shard_for(org_id, config=None):
+    """Name of the shard holding ``org_id``; None when sharding is off."""
+    config = config or current_app.config
+    mode = config.get("TENANT_SHARDING")
+    if not mode:
+        return None
+    if mode == "org":
+        return f"org_{int(org_id)}"
+    if mode == "hash":
+        count = int(config.get("TENANT_SHARD_COUNT", 16))
+        return f"shard_{zlib.crc32(str(int(org_id)).encode()) % count:03d}"
+    raise ValueError(f"TENANT_SHARDING must be '', 'org' or 'hash', not {mode!r}")
+
+
+def current_shard():
+    """The shard tenant statements go to right now, or None."""
+    shard = _scope.get()
+    if shard is None and has_request_context():
+        shard = g.get("_tenant_shard")
+        if shard is None and current_user.is_authenticated:
+            shard = g._tenant_shard = shard_for(current_user.org_id)
+    return shard
+
+
+def directory_tables(metadata):
+    return [table for table in metadata.sorted_tables if table.name in DIRECTORY_TABLES]
+
+
+def tenant_tables(metadata):
+    return [table for table in metadata.sorted_tables if table.name not in DIRECTORY_TABLES]
+
+
+def on_shard_open(hook):
+    """Register ``hook(engine)`` to run when a shard is first opened in this process."""
+    _on_open.append(hook)
+    return hook
+
+
+def _db():
+    return current_app.extensions["sqlalchemy"]
+
+
+def _shard_url(shard):
+    return current_app.config["TENANT_DATABASE_URL"].format(shard=shard)
+
+
+def _open(url):
+    config = current_app.config
+    database = make_url(url).database
+    if make_url(url).get_backend_name() == "sqlite" and database not in (None, "", ":memory:"):
+        os.makedirs(os.path.dirname(os.path.abspath(database)), exist_ok=True)
+    engine = sa.create_engine(url, **engine_options(dict(config, SQLALCHEMY_DATABASE_URI=url)))
+    metadata = _db().metadata
+    metadata.create_all(engine, tables=tenant_tables(metadata))
+    for hook in _on_open:
+        hook(engine)
+    return engine
+
+
+def shard_engine(shard):
+    url = _shard_url(shard)
+    engine = _engines.get(url)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = _engines[url] = _open(url)
+    return engine
+
+
+def _table_names(mapper, clause):
+    if mapper is not None:
+        return {sa.inspect(mapper).local_table.name}
+    if isinstance(clause, sa.Table):
+        return {clause.name}
+    if isinstance(clause, sa.UpdateBase) and isinstance(clause.table, sa.Table):
+        return {clause.table.name}
+    if clause is not None:
+        return {table.name for table in find_tables(clause) if isinstance(table, sa.Table)}
+    return set()
+
+
+class TenantSession(Session):
+    """db.session, routing tenant tables to the current shard when sharding is on."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and sharding_enabled():
+            names = _table_names(mapper, clause)
+            if names & DIRECTORY_TABLES:
+                if names - DIRECTORY_TABLES:
+                    raise RuntimeError(f"Statement mixes directory and tenant tables: {sorted(names)}")
+            else:
+                shard = current_shard()
+                if shard is not None:
+                    return shard_engine(shard)
+                if names:
+                    raise RuntimeError(f"No tenant selected for {sorted(names)}; use tenant_scope(org_id)")
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@contextmanager
+def shard_scope(shard):
+    """Route tenant tables to ``shard`` inside the block; None leaves routing as is."""
+    token = _scope.set(shard)
+    try:
+        yield shard
+    finally:
+        if shard is not None:
+            _db().session.close()  # Its identity map belongs to this shard
+        _scope.reset(token)
+
+
+def tenant_scope(org_id):
+    """shard_scope for the shard holding ``org_id``; a no-op when sharding is off."""
+    return shard_scope(shard_for(org_id))
+
+
+def known_shards():
+    """Every shard holding at least one organization, or [None] when sharding is off."""
+    if not sharding_enabled():
+        return [None]
+    organizations = _db().metadata.tables["organizations"]
+    org_ids = _db().session.execute(sa.select(organizations.c.org_id)).scalars().all()
+    return sorted({shard_for(org_id) for org_id in org_ids})
+
+
+def create_directory():
+    """db.create_all(), limited to the directory tables when sharding is on."""
+    db = _db()
+    if sharding_enabled():
+        db.metadata.create_all(db.engine, tables=directory_tables(db.metadata))
+    else:
+        db.create_all()
+
+
+def drop_shards():
+    """Drop the tenant tables, search index included, of every known shard."""
+    from search_index import SEARCH_TABLE
+
+    if not sa.inspect(_db().engine).has_table("organizations"):
+        return
+    metadata = _db().metadata
+    for shard in known_shards():
+        url = _shard_url(shard)
+        engine = shard_engine(shard)
+        metadata.drop_all(engine, tables=tenant_tables(metadata))
+        with engine.begin() as conn:
+            conn.execute(sa.text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+        with _engines_lock:
+            _engines.pop(url, None)
+        engine.dispose()
+
+
+def unmigrated_tables(engine=None):
+    """Tenant tables still holding rows in the directory database."""
+    db = _db()
+    engine = engine or db.engine
+    existing = set(sa.inspect(engine).get_table_names())
+    with engine.connect() as conn:
+        return [
+            table.name for table in tenant_tables(db.metadata)
+            if table.name in existing and conn.execute(sa.select(sa.literal(1)).select_from(table).limit(1)).first()
+        ]
+
+
+def check_directory():
+    """Refuse to run sharded while the directory still holds tenant rows."""
+    names = [] if _migrating else unmigrated_tables()
+    if names:
+        raise RuntimeError(f"TENANT_SHARDING is on but the directory database still holds {', '.join(names)}; "
+                           "copy them into the shards with: python sharding.py migrate")
+
+
+def _org_rows(table, org_ids):
+    """Where clause for the rows of ``table`` owned by ``org_ids``; None for shared reference tables."""
+    if "org_id" in table.c:
+        return table.c.org_id.in_(org_ids)
+    if "product_id" in table.c:
+        products = table.metadata.tables["products"]
+        return table.c.product_id.in_(sa.select(products.c.product_id).where(products.c.org_id.in_(org_ids)))
+    return None
+
+
+def migrate():
+    """Copy each org's tenant rows from the directory database into its shard.
+
+    Reference tables (brands, categories, volumes) are copied to every shard.
+    A shard already holding rows of its orgs is skipped, so an interrupted run
+    can be repeated. Once every shard has its rows, the tenant tables are
+    dropped from the directory. Returns {shard: rows copied, None if skipped}.
+    """
+    from search_index import SEARCH_TABLE, rebuild_index
+
+    db = _db()
+    source = db.engine
+    inspector = sa.inspect(source)
+    existing = set(inspector.get_table_names())
+    tables = [table for table in tenant_tables(db.metadata) if table.name in existing]
+    for table in tables:
+        missing = set(table.c.keys()) - {column["name"] for column in inspector.get_columns(table.name)}
+        if missing:
+            raise RuntimeError(f"{table.name} lacks {', '.join(sorted(missing))}; "
+                               "start the app once with TENANT_SHARDING off to upgrade it first")
+
+    organizations = db.metadata.tables["organizations"]
+    org_ids_by_shard = defaultdict(list)
+    with source.connect() as conn:
+        for org_id in conn.execute(sa.select(organizations.c.org_id)).scalars():
+            org_ids_by_shard[shard_for(org_id)].append(org_id)
+
+    copied = {}
+    for shard, org_ids in sorted(org_ids_by_shard.items()):
+        target = shard_engine(shard)
+        owned = [(table, _org_rows(table, org_ids)) for table in tables]
+        with target.connect() as conn:
+            if any(conn.execute(sa.select(sa.literal(1)).select_from(table).where(where).limit(1)).first()
+                   for table, where in owned if where is not None):
+                copied[shard] = None
+                continue
+        copied[shard] = 0
+        with source.connect() as src, target.begin() as dst:
+            for table, where in owned:
+                query = sa.select(table) if where is None else sa.select(table).where(where)
+                result = src.execution_options(yield_per=MIGRATE_CHUNK_SIZE).execute(query)
+                for rows in result.mappings().partitions():
+                    dst.execute(table.insert(), [dict(row) for row in rows])
+                    copied[shard] += len(rows)
+        with shard_scope(shard):
+            rebuild_index()
+
+    with source.begin() as conn:
+        conn.execute(sa.text(f"DROP TABLE IF EXISTS {SEARCH_TABLE}"))
+    db.metadata.drop_all(source, tables=tables)
+    return copied
+
+
+def main(argv=None):
+    global _migrating
+    parser = argparse.ArgumentParser(description="Tenant shard maintenance.")
+    parser.add_argument("command", choices=["migrate"], help="copy tenant rows from the directory into the shards")
+    parser.parse_args(argv)
+
+    _migrating = True  # App startup would refuse the unmigrated directory
+    from app import app
+    with app.app_context():
+        if not sharding_enabled():
+            print("❌ TENANT_SHARDING is off; set it to 'org' or 'hash' first.")
+            return 1
+        try:
+            copied = migrate()
+        except (RuntimeError, sa.exc.IntegrityError) as e:
+            print(f"❌ Migration failed: {e}")
+            return 1
+    for shard, rows in copied.items():
+        print(f"⏭️ {shard}: already migrated" if rows is None else f"📦 {shard}: {rows} row(s)")
+    print(f"✅ Migrated {len(copied)} shard(s); the directory now only holds {', '.join(sorted(DIRECTORY_TABLES))}.")
+    return 0
+
+
+# Usage: TENANT_SHARDING=org python sharding.py migrate
+if __name__ == "__main__":
+    import sharding  # The module app.py routes through, not this __main__ copy
+    sys.exit(sharding.main())
@@ -0,0 +1,250 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import case, func, inspect
+from models import db, Stock, StockUpdate, StockUpdateDay, StockSnapshot, Sale, Product
+from sharding import tenant_scope
+
+# One row per (org, product, day) that saw a stock change, holding the
+# opening and closing quantity plus units sold and manually adjusted that
+# day. Days without a row carry the previous row's closing quantity, so
+# "stock at the start of day D" is one indexed read over snapshot_date.
+#
+# Stock changes are attributed to the day they are effective on: manual
+# updates to the day they are made, sales to their sale_date. A back-dated
+# sale therefore also shifts every later snapshot of that product.
+
+
+def ensure_stock_snapshots():
+    """Create the snapshot table on databases that predate it (backfill is explicit)."""
+    inspector = inspect(db.engine)
+    if inspector.has_table(Product.__tablename__) and not inspector.has_table(StockSnapshot.__tablename__):
+        StockSnapshot.__table__.create(db.engine, checkfirst=True)
+
+
+def _closing_before(org_id, product_ids, day):
+    latest = (
+        db.session.query(StockSnapshot.product_id, func.max(StockSnapshot.snapshot_date).label("snapshot_date"))
+        .filter(StockSnapshot.org_id == org_id, StockSnapshot.product_id.in_(product_ids),
+                StockSnapshot.snapshot_date < day)
+        .group_by(StockSnapshot.product_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(StockSnapshot.product_id, StockSnapshot.closing_quantity)
+        .join(latest, (StockSnapshot.product_id == latest.c.product_id)
+              & (StockSnapshot.snapshot_date == latest.c.snapshot_date))
+        .filter(StockSnapshot.org_id == org_id)
+    )
+    return dict(rows)
+
+
+def _opening_after(org_id, product_ids, day):
+    earliest = (
+        db.session.query(StockSnapshot.product_id, func.min(StockSnapshot.snapshot_date).label("snapshot_date"))
+        .filter(StockSnapshot.org_id == org_id, StockSnapshot.product_id.in_(product_ids),
+                StockSnapshot.snapshot_date > day)
+        .group_by(StockSnapshot.product_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(StockSnapshot.product_id, StockSnapshot.opening_quantity)
+        .join(earliest, (StockSnapshot.product_id == earliest.c.product_id)
+              & (StockSnapshot.snapshot_date == earliest.c.snapshot_date))
+        .filter(StockSnapshot.org_id == org_id)
+    )
+    return dict(rows)
+
+
+def record_stock_changes(org_id, day, changes):
+    """Fold a batch of stock changes effective on ``day`` into the snapshots.
+
+    ``changes`` maps product_id -> (previous_quantity, new_quantity, sold),
+    where ``sold`` is the change in units sold (0 for manual updates). Runs a
+    fixed number of set-based statements regardless of batch size; the
+    caller commits.
+    """
+    changes = {product_id: change for product_id, change in changes.items() if change[0] != change[1] or change[2]}
+    if not changes:
+        return
+    product_ids = list(changes)
+
+    existing = {
+        snapshot.product_id: snapshot for snapshot in StockSnapshot.query.filter(
+            StockSnapshot.org_id == org_id,
+            StockSnapshot.snapshot_date == day,
+            StockSnapshot.product_id.in_(product_ids)
+        )
+    }
+    missing = [product_id for product_id in product_ids if product_id not in existing]
+    openings = _closing_before(org_id, missing, day) if missing else {}
+    if day < date.today():
+        unknown = [product_id for product_id in missing if product_id not in openings]
+        if unknown:
+            openings.update(_opening_after(org_id, unknown, day))
+
+    updates, inserts, shifts = [], [], {}
+    for product_id, (previous_quantity, new_quantity, sold) in changes.items():
+        delta = new_quantity - previous_quantity
+        snapshot = existing.get(product_id)
+        if snapshot:
+            updates.append({
+                "snapshot_id": snapshot.snapshot_id,
+                "closing_quantity": snapshot.closing_quantity + delta,
+                "sold_quantity": snapshot.sold_quantity + sold,
+                "adjusted_quantity": snapshot.adjusted_quantity + delta + sold
+            })
+        else:
+            # No earlier history means stock was untouched until now
+            opening = openings.get(product_id, previous_quantity)
+            inserts.append({
+                "org_id": org_id,
+                "product_id": product_id,
+                "snapshot_date": day,
+                "opening_quantity": opening,
+                "closing_quantity": opening + delta,
+                "sold_quantity": sold,
+                "adjusted_quantity": delta + sold
+            })
+        if delta:
+            shifts[product_id] = delta
+
+    if updates:
+        db.session.bulk_update_mappings(StockSnapshot, updates)
+    if inserts:
+        db.session.bulk_insert_mappings(StockSnapshot, inserts)
+
+    if shifts and day < date.today():
+        shift = case(shifts, value=StockSnapshot.product_id, else_=0)
+        StockSnapshot.query.filter(
+            StockSnapshot.org_id == org_id,
+            StockSnapshot.snapshot_date > day,
+            StockSnapshot.product_id.in_(list(shifts))
+        ).update({
+            StockSnapshot.opening_quantity: StockSnapshot.opening_quantity + shift,
+            StockSnapshot.closing_quantity: StockSnapshot.closing_quantity + shift
+        }, synchronize_session=False)
+
+
+def stock_at_start_of(org_id, day):
+    """Opening stock per product on ``day`` from the snapshots, in one query.
+
+    Products without any snapshot on or before ``day`` are left out.
+    """
+    latest = (
+        db.session.query(StockSnapshot.product_id, func.max(StockSnapshot.snapshot_date).label("snapshot_date"))
+        .filter(StockSnapshot.org_id == org_id, StockSnapshot.snapshot_date <= day)
+        .group_by(StockSnapshot.product_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(StockSnapshot.product_id, StockSnapshot.snapshot_date,
+                         StockSnapshot.opening_quantity, StockSnapshot.closing_quantity)
+        .join(latest, (StockSnapshot.product_id == latest.c.product_id)
+              & (StockSnapshot.snapshot_date == latest.c.snapshot_date))
+        .filter(StockSnapshot.org_id == org_id)
+    )
+    return {
+        product_id: opening if snapshot_date == day else closing
+        for product_id, snapshot_date, opening, closing in rows
+    }
+
+
+def backfill_snapshots(org_id, date_from, date_to=None):
+    """Rebuild dense daily snapshots for ``date_from``..``date_to`` from history.
+
+    Walks backwards from today's stock, undoing each day's sales (from the
+    sales table) and manual adjustments (from the StockUpdate ledger, and its
+    per-day summaries for days retention has archived). Rows
+    in the range are replaced; the caller commits.
+    """
+    today = date.today()
+    date_to = min(date_to or today, today)
+    levels = dict(
+        db.session.query(Stock.product_id, func.sum(Stock.quantity))
+        .filter(Stock.org_id == org_id)
+        .group_by(Stock.product_id)
+    )
+    for (product_id,) in db.session.query(Product.product_id).filter(Product.org_id == org_id):
+        levels.setdefault(product_id, 0)
+
+    sold = {}
+    for product_id, sale_date, quantity in (
+        db.session.query(Sale.product_id, Sale.sale_date, func.sum(Sale.quantity_sold))
+        .filter(Sale.org_id == org_id, Sale.sale_date >= date_from)
+        .group_by(Sale.product_id, Sale.sale_date)
+    ):
+        sold[product_id, sale_date] = int(quantity)
+
+    adjusted = {}
+    update_day = func.date(StockUpdate.update_time)
+    for product_id, day, delta in (
+        db.session.query(StockUpdate.product_id, update_day,
+                         func.sum(StockUpdate.new_quantity - StockUpdate.previous_quantity))
+        .join(Product, Product.product_id == StockUpdate.product_id)
+        .filter(Product.org_id == org_id, StockUpdate.update_time >= date_from)
+        .group_by(StockUpdate.product_id, update_day)
+    ):
+        if isinstance(day, str):
+            day = datetime.strptime(day, "%Y-%m-%d").date()
+        adjusted[product_id, day] = int(delta)
+    for product_id, day, delta in (
+        db.session.query(StockUpdateDay.product_id, StockUpdateDay.day, StockUpdateDay.net_change)
+        .join(Product, Product.product_id == StockUpdateDay.product_id)
+        .filter(Product.org_id == org_id, StockUpdateDay.day >= date_from)
+    ):
+        adjusted[product_id, day] = adjusted.get((product_id, day), 0) + delta
+
+    StockSnapshot.query.filter(
+        StockSnapshot.org_id == org_id,
+        StockSnapshot.snapshot_date >= date_from,
+        StockSnapshot.snapshot_date <= date_to
+    ).delete(synchronize_session=False)
+
+    written = 0
+    day = today
+    while day >= date_from:
+        rows = []
+        for product_id, closing in levels.items():
+            day_sold = sold.get((product_id, day), 0)
+            day_adjusted = adjusted.get((product_id, day), 0)
+            opening = closing + day_sold - day_adjusted
+            if day <= date_to:
+                rows.append({
+                    "org_id": org_id,
+                    "product_id": product_id,
+                    "snapshot_date": day,
+                    "opening_quantity": opening,
+                    "closing_quantity": closing,
+                    "sold_quantity": day_sold,
+                    "adjusted_quantity": day_adjusted
+                })
+            levels[product_id] = opening
+        if rows:
+            db.session.bulk_insert_mappings(StockSnapshot, rows)
+            written += len(rows)
+        day -= timedelta(days=1)
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill daily stock snapshots for an organization.")
+    parser.add_argument("org_id", type=int)
+    parser.add_argument("date_from", help="first day to rebuild (YYYY-MM-DD)")
+    parser.add_argument("date_to", nargs="?", help="last day to rebuild (default: today)")
+    args = parser.parse_args(argv)
+
+    date_from = datetime.strptime(args.date_from, "%Y-%m-%d").date()
+    date_to = datetime.strptime(args.date_to, "%Y-%m-%d").date() if args.date_to else None
+
+    from app import app
+    with app.app_context(), tenant_scope(args.org_id):
+        written = backfill_snapshots(args.org_id, date_from, date_to)
+        db.session.commit()
+    print(f"✅ Wrote {written} snapshot rows for org {args.org_id}.")
+    return 0
+
+
+# Usage: python stock_snapshots.py <org_id> <from YYYY-MM-DD> [to YYYY-MM-DD]
+if __name__ == "__main__":
+    sys.exit(main())
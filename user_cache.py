@@ -0,0 +1,47 @@
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+from catalog_cache import LRUCache
+from models import db, User
+
+# Short-TTL cache of the logged-in user's identity columns, shared by the
+# requests of one worker, so the user_loader costs no query in steady state.
+# The loader rebuilds a User from the cached values and attaches it to the
+# request's session without a SELECT; writes to current_user are flushed as
+# usual. password_hash and otp_secret are never cached: they load on first
+# access, which only the password and 2FA routes do. Routes that change a
+# user row call invalidate_user after committing; the TTL bounds staleness
+# in other workers.
+
+_CACHED_COLUMNS = (
+    "user_id", "name", "email", "role", "org_id", "created_at", "needs_password_change",
+    "failed_login_attempts", "is_locked", "lockout_time"
+)
+
+_users = LRUCache(maxsize=1024)
+
+
+def _attach(values):
+    user = User(**values)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+def get_user(user_id):
+    values = _users.get(user_id)
+    if values is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        values = {column: getattr(user, column) for column in _CACHED_COLUMNS}
+        _users.maxsize = current_app.config.get("USER_CACHE_SIZE", _users.maxsize)
+        _users.put(user_id, values, current_app.config.get("USER_CACHE_TTL", 30))
+        return user
+    return _attach(values)
+
+
+def invalidate_user(user_id):
+    _users.delete(user_id)
+
+
+def user_cache_stats():
+    return {"hits": _users.hits, "misses": _users.misses, "entries": len(_users), "maxsize": _users.maxsize}
@@ -1,9 +1,8 @@
-from models import db, UserActionLog
+from audit_log import audit_log
 
 def log_action(user_id, action):
+    """Queue an audit record; it is written in the background (see audit_log.py)."""
     if user_id is not None:
-        log_entry = UserActionLog(user_id=user_id, action=action)
-        db.session.add(log_entry)
-        db.session.commit()
+        audit_log.enqueue(user_id, action)
     else:
-        print("Error: user_id is None, cannot log action.") 
\ No newline at end of file
+        print("Error: user_id is None, cannot log action.")